@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+
+ QGIS Solothurn Locator Plugin
+ Copyright (C) 2019 Denis Rouzaud
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+Benchmarks the parsing of a large synthetic layergroup: decoding the whole JSON content and building the tree
+from the decoded data (as done before the QML styles were kept raw) against parse_data_product.
+
+From the repository root, in the QGIS Python environment:
+
+    python -m benchmarks.parse_data_product [--layers 500] [--qml-size 20000] [--repeat 5]
+"""
+
+import argparse
+import json
+import timeit
+import tracemalloc
+
+from solocator.core.data_product_parser import parse_data_product, DEFAULT_CRS
+from solocator.core.data_products import LAYER_GROUP, FACADE_LAYER
+from solocator.core.json_decoder import loads
+from solocator.core.layer import SoLayer, SoGroup
+
+
+def synthetic_layergroup(layers: int, qml_size: int) -> bytes:
+    """
+    :param layers: the number of sublayers
+    :param qml_size: the size of the QML style of each layer
+    """
+    qml = '<qgis version="3.10">\n' + '<rule filter="&quot;art&quot; = \'x\'" label="Kategorie"/>\n' * (qml_size // 60) + '</qgis>'
+    sublayers = []
+    for i in range(layers):
+        sublayers.append({
+            'type': 'layer',
+            'display': 'Layer {}'.format(i),
+            'description': 'Beschreibung von Layer {}'.format(i),
+            'wms_datasource': {'service_url': 'https://geo.so.ch/wms', 'name': 'ch.so.layer_{}'.format(i)},
+            'postgis_datasource': {
+                'dbconnection': 'postgresql://geo-db.so.ch:5432/pub', 'data_set_name': 'schema.table_{}'.format(i),
+                'geometry_field': 'geometrie', 'geometry_type': 'POLYGON', 'srid': 2056
+            },
+            'qml': qml,
+        })
+    product = {
+        'type': 'layergroup',
+        'display': 'Synthetic layergroup',
+        'wms_datasource': {'service_url': 'https://geo.so.ch/wms', 'name': 'ch.so.layergroup'},
+        'sublayers': sublayers,
+    }
+    return json.dumps(product).encode('utf-8')
+
+
+def decode_then_build(content: bytes):
+    def build(data: dict):
+        layer = SoLayer(data['display'], False, data.get('crs', DEFAULT_CRS), data['wms_datasource'],
+                        data.get('postgis_datasource'), data.get('description'), data.get('qml'))
+        if data['type'] in (LAYER_GROUP, FACADE_LAYER):
+            return SoGroup(data['display'], [build(child) for child in data['sublayers']], layer, data['type'])
+        return layer
+    return build(loads(content))
+
+
+def measure(label: str, func, content: bytes, repeat: int):
+    seconds = min(timeit.repeat(lambda: func(content), number=1, repeat=repeat))
+    tracemalloc.start()
+    func(content)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print('{:<20} {:8.1f} ms {:8.1f} MB peak'.format(label, seconds * 1000, peak / 1024 / 1024))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the parsing of a large data product')
+    parser.add_argument('--layers', type=int, default=500, help='number of sublayers')
+    parser.add_argument('--qml-size', type=int, default=20000, help='size of the QML style of each layer')
+    parser.add_argument('--repeat', type=int, default=5, help='number of repetitions, the best one is reported')
+    args = parser.parse_args()
+
+    content = synthetic_layergroup(args.layers, args.qml_size)
+    print('{} layers, {:.1f} MB of JSON'.format(args.layers, len(content) / 1024 / 1024))
+    measure('decode then build', decode_then_build, content, args.repeat)
+    measure('parse_data_product', lambda c: parse_data_product(c, False), content, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+
+ QGIS Solothurn Locator Plugin
+ Copyright (C) 2019 Denis Rouzaud
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+Benchmarks the records of the results of a large search response: the memory they retain once the response
+is released and the time to create them, for the compact records against plain records keeping the raw sublayers
+(as the results did before).
+
+From the repository root, in the QGIS Python environment:
+
+    python -m benchmarks.result_records [--results 1000] [--sublayers 10] [--repeat 5]
+"""
+
+import argparse
+import gc
+import json
+import timeit
+import tracemalloc
+
+from solocator.core.json_decoder import loads
+from solocator.core.solocator_filter import FeatureResult, DataProductResult
+
+
+class PlainFeatureResult:
+    def __init__(self, dataproduct_id, id_field_name, id_field_type, feature_id):
+        self.dataproduct_id = dataproduct_id
+        self.id_field_name = id_field_name
+        self.id_field_type = id_field_type
+        self.feature_id = feature_id
+
+
+class PlainDataProductResult:
+    def __init__(self, type, dataproduct_id, display, dset_info, stacktype, sublayers):
+        self.type = type
+        self.dataproduct_id = dataproduct_id
+        self.display = display
+        self.dset_info = dset_info
+        self.stacktype = stacktype
+        self.sublayers = sublayers
+
+
+def synthetic_response(results: int, sublayers: int) -> bytes:
+    """
+    Half of the results are features, the other half data products, one in two being a group with sublayers
+    :param results: the number of results
+    :param sublayers: the number of sublayers of the groups
+    """
+    data = []
+    for i in range(results):
+        if i % 2:
+            data.append({'feature': {
+                'display': 'Baselstrasse {}, 4500 Solothurn'.format(i),
+                'dataproduct_id': 'ch.so.agi.av.gebaeudeadressen.gebaeudeeingaenge',
+                'id_field_name': 't_id', 'id_field_type': 'int', 'feature_id': i
+            }})
+        else:
+            layers = [{
+                'display': 'Layer {} {}'.format(i, j), 'dataproduct_id': 'ch.so.layer_{}_{}'.format(i, j),
+                'type': 'layer', 'dset_info': True, 'stacktype': 'foreground'
+            } for j in range(sublayers if i % 4 == 0 else 0)]
+            data.append({'dataproduct': {
+                'display': 'Data product {}'.format(i), 'dataproduct_id': 'ch.so.dataproduct_{}'.format(i),
+                'type': 'layergroup' if layers else 'layer', 'dset_info': True, 'stacktype': 'foreground',
+                'sublayers': layers
+            }})
+    return json.dumps({'result_counts': [], 'results': data}).encode('utf-8')
+
+
+def records(content: bytes, feature_class, data_product_class) -> list:
+    """
+    Creates the records of the results and their sublayers as handle_response does
+    """
+    created = []
+    for res in loads(content)['results']:
+        if 'feature' in res:
+            f = res['feature']
+            created.append(feature_class(f['dataproduct_id'], f['id_field_name'], f['id_field_type'], f['feature_id']))
+        else:
+            dp = res['dataproduct']
+            for data in [dp] + dp['sublayers']:
+                created.append(data_product_class(
+                    data['type'], data['dataproduct_id'], data['display'], data['dset_info'], dp['stacktype'],
+                    data.get('sublayers')
+                ))
+    return created
+
+
+def measure(label: str, content: bytes, feature_class, data_product_class, repeat: int):
+    seconds = min(timeit.repeat(lambda: records(content, feature_class, data_product_class), number=1, repeat=repeat))
+    gc.collect()
+    tracemalloc.start()
+    created = records(content, feature_class, data_product_class)
+    # the response is released, only the records are kept
+    gc.collect()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print('{:<10} {} records {:8.1f} ms {:8.2f} MB retained'.format(
+        label, len(created), seconds * 1000, retained / 1024 / 1024
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the records of the results of a large search response')
+    parser.add_argument('--results', type=int, default=1000, help='number of results in the response')
+    parser.add_argument('--sublayers', type=int, default=10, help='number of sublayers of the groups')
+    parser.add_argument('--repeat', type=int, default=5, help='number of repetitions, the best one is reported')
+    args = parser.parse_args()
+
+    content = synthetic_response(args.results, args.sublayers)
+    print('{} results, {:.1f} kB of JSON'.format(args.results, len(content) / 1024))
+    measure('plain', content, PlainFeatureResult, PlainDataProductResult, args.repeat)
+    measure('compact', content, FeatureResult, DataProductResult, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+
+ QGIS Solothurn Locator Plugin
+ Copyright (C) 2019 Denis Rouzaud
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import re
+
+from qgis.core import QgsPointXY
+
+LV95 = 'EPSG:2056'
+LV03 = 'EPSG:21781'
+WGS84 = 'EPSG:4326'
+
+CRS_LABELS = {
+    LV95: 'LV95',
+    LV03: 'LV03',
+    WGS84: 'WGS84'
+}
+
+# numbers with optional swiss thousands separators (2'600'000) and decimals
+NUMBER = r"\d+(?:['’]\d{3})*(?:\.\d+)?"
+COORDINATE_REGEX = re.compile(
+    r"^\s*(?:[EeXx]\s*[:=]?\s*)?(?P<first>{number})\s*[,;/\s]\s*(?:[NnYy]\s*[:=]?\s*)?(?P<second>{number})\s*$".format(number=NUMBER)
+)
+
+# rough bounds (slightly larger than Switzerland) used to recognize the coordinate system
+# each entry is (crs, (xmin, xmax), (ymin, ymax))
+BOUNDS = (
+    (LV95, (2450000, 2850000), (1050000, 1310000)),
+    (LV03, (450000, 850000), (50000, 310000)),
+    (WGS84, (5.5, 11.0), (45.5, 48.0)),
+)
+
+
+def parse_number(text: str) -> float:
+    return float(text.replace("'", '').replace('’', ''))
+
+
+def parse_coordinate(search: str):
+    """
+    Recognizes coordinates in LV95, LV03 or WGS84 (with decimals) in a search text.
+    Values can be given in either order (e.g. latitude first for WGS84).
+    :param search: the search text
+    :return: a tuple (QgsPointXY, crs authid) or None if the text is not a coordinate
+    """
+    match = COORDINATE_REGEX.match(search)
+    if not match:
+        return None
+    first = parse_number(match.group('first'))
+    second = parse_number(match.group('second'))
+    # small integers (e.g. "8 46", a street number) are searched, WGS84 degrees must have decimals
+    decimals = '.' in match.group('first') and '.' in match.group('second')
+    for crs, (xmin, xmax), (ymin, ymax) in BOUNDS:
+        if crs == WGS84 and not decimals:
+            continue
+        for x, y in ((first, second), (second, first)):
+            if xmin <= x <= xmax and ymin <= y <= ymax:
+                return QgsPointXY(x, y), crs
+    return None
+
+
+def format_coordinate(point: QgsPointXY, crs: str) -> str:
+    if crs == WGS84:
+        return '{y:.6f}, {x:.6f} ({label})'.format(x=point.x(), y=point.y(), label=CRS_LABELS[crs])
+    return "{x:,.0f} / {y:,.0f} ({label})".format(x=point.x(), y=point.y(), label=CRS_LABELS[crs]).replace(',', "'")
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+
+ QGIS Solothurn Locator Plugin
+ Copyright (C) 2019 Denis Rouzaud
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import json
+import os
+import threading
+import time
+
+from solocator.core.data_products import DATA_PRODUCTS
+from solocator.core.utils import local_file_path, dbg_info
+
+FILE_NAME = 'dataproduct_catalog.json'
+# minimum interval between two searches made to complete the catalog (seconds)
+HARVEST_INTERVAL = 600
+
+
+class DataProductCatalog:
+    """
+    The catalog of the data products which can be used to filter the search.
+    It starts from the built-in DATA_PRODUCTS and is completed with the data products
+    (ID and filter word) returned by the search service in result_counts of unfiltered searches
+    (the searches of the user are filtered with the catalog, so they only return known data products).
+    The catalog is cached locally, it is read from worker threads and updated from any thread.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self._entries = None
+        self.last_harvest = None
+
+    @property
+    def entries(self) -> dict:
+        # must be called with the lock acquired
+        if self._entries is None:
+            self._entries = dict(DATA_PRODUCTS)
+            if os.path.exists(self.path):
+                try:
+                    with open(self.path, encoding='utf-8') as fh:
+                        self._entries.update(json.load(fh))
+                except (OSError, ValueError) as e:
+                    dbg_info('could not read data product catalog: {}'.format(e))
+        return self._entries
+
+    def items(self) -> list:
+        """
+        Returns the list of (data product ID, name)
+        """
+        with self.lock:
+            return list(self.entries.items())
+
+    def ids(self) -> list:
+        with self.lock:
+            return list(self.entries.keys())
+
+    def claim_harvest(self) -> bool:
+        """
+        Returns True at most once per HARVEST_INTERVAL, when the caller should make an unfiltered search to harvest
+        """
+        with self.lock:
+            now = time.monotonic()
+            if self.last_harvest is not None and now - self.last_harvest < HARVEST_INTERVAL:
+                return False
+            self.last_harvest = now
+            return True
+
+    def harvest(self, result_counts: list) -> bool:
+        """
+        Adds the data products returned by the search service
+        :param result_counts: the result_counts of an unfiltered search response
+        :return: True if the catalog has changed
+        """
+        changed = False
+        with self.lock:
+            for result_count in result_counts:
+                _id = result_count.get('dataproduct_id')
+                if _id and _id not in self.entries:
+                    self.entries[_id] = result_count.get('filterword') or _id
+                    changed = True
+            content = dict(self.entries) if changed else None
+        if changed:
+            self.save(content)
+        return changed
+
+    def save(self, content: dict):
+        try:
+            tmp_path = '{}.{}.tmp'.format(self.path, threading.get_ident())
+            with open(tmp_path, 'w', encoding='utf-8') as fh:
+                json.dump(content, fh)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            dbg_info('could not write data product catalog: {}'.format(e))
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def data_product_catalog() -> DataProductCatalog:
+    """
+    Returns the data product catalog shared by all filter instances
+    """
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = DataProductCatalog(local_file_path(FILE_NAME))
+        return _catalog
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+
+ QGIS Solothurn Locator Plugin
+ Copyright (C) 2019 Denis Rouzaud
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import re
+
+from solocator.core.layer import SoLayer, SoGroup, LazyQml
+from solocator.core.data_products import LAYER_GROUP, FACADE_LAYER
+from solocator.core.json_decoder import buffer, loads
+
+DEFAULT_CRS = 'EPSG:2056'
+
+# the beginning of a "qml" string value
+QML_KEY_REGEX = re.compile(rb'"qml"\s*:\s*"')
+# a quote followed by the end of a value, the end of the string if the quote is not escaped
+STRING_END_REGEX = re.compile(rb'"\s*[,}\]]')
+BACKSLASH = ord('\\')
+
+
+def qml_string_spans(content):
+    """
+    Yields the start and end of the "qml" strings of the content, without their quotes (still escaped)
+    :param content: bytes or memoryview
+    """
+    position = 0
+    while True:
+        match = QML_KEY_REGEX.search(content, position)
+        if match is None:
+            return
+        start = end = match.end()
+        while True:
+            match = STRING_END_REGEX.search(content, end)
+            if match is None:
+                # invalid content, reported by the decoder
+                return
+            end = match.start()
+            backslash = end
+            while content[backslash - 1] == BACKSLASH:
+                backslash -= 1
+            if (end - backslash) % 2 == 0:
+                break
+            # escaped quote in the style
+            end += 1
+        yield start, end
+        position = end + 1
+
+
+def parse_data_product(content, is_background: bool):
+    """
+    Builds the SoGroup/SoLayer tree of a data product from the decoded JSON content.
+    The embedded QML styles are not decoded but kept as raw slices of the content until a layer needs its style.
+    :param content: the JSON content of the data product (QByteArray, bytes or str)
+    :param is_background: if the data product is a background map
+    :return: the SoGroup or SoLayer
+    """
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    # slices of a memoryview are not copied
+    content = memoryview(buffer(content))
+
+    # replace the QML strings by their index in qml_slices
+    qml_slices = []
+    pieces = []
+    last = 0
+    for start, end in qml_string_spans(content):
+        pieces.append(content[last:start - 1])
+        pieces.append(str(len(qml_slices)).encode())
+        qml_slices.append(content[start:end])
+        last = end + 1
+    pieces.append(content[last:])
+    stripped = b''.join(pieces)
+
+    def restore_qml(value):
+        # in place: the QML placeholders (indexes in qml_slices) of any object become LazyQml
+        if isinstance(value, dict):
+            qml = value.get('qml')
+            if isinstance(qml, int):
+                value['qml'] = LazyQml(qml_slices[qml])
+            for key, item in value.items():
+                # the sublayers are handled when they are built
+                if key != 'sublayers' and isinstance(item, (dict, list)):
+                    restore_qml(item)
+        elif isinstance(value, list):
+            for item in value:
+                restore_qml(item)
+
+    def build(data: dict):
+        # a single pass over the decoded layers, the dicts are not copied
+        restore_qml(data)
+        crs = data.get('crs', DEFAULT_CRS)
+        layer = SoLayer(data['display'], is_background, crs, data['wms_datasource'], data.get('postgis_datasource'),
+                        data.get('description'), data.get('qml'))
+        if data['type'] in (LAYER_GROUP, FACADE_LAYER):
+            return SoGroup(data['display'], [build(child) for child in data['sublayers']], layer, data['type'])
+        return layer
+
+    return build(loads(stripped))
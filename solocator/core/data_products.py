@@ -18,6 +18,8 @@
 """
 
 import os
+from functools import lru_cache
+
 from qgis.PyQt.QtGui import QIcon
 
 from solocator import PLUGIN_DIR
@@ -44,6 +46,8 @@ DATAPRODUCT_TYPE_TRANSLATION = {
 }
 
 
+# icons are loaded once, the same ones are used for all the results
+@lru_cache(maxsize=256)
 def dataproduct2icon_description(data_product: str, layer_type: str) -> QIcon:
     """
     Returns an icon for a given data product
@@ -116,10 +120,26 @@ def image_format_force_jpeg(name: str, is_background: str) -> bool:
         return False
 
 
-def force_wms(data: dict, is_background: bool) -> bool:
+def adaptive_image_format(throughput: float, slow_throughput: float, fast_throughput: float) -> (str, int):
+    """
+    Returns the WMS image format and DPI mode adapted to the measured throughput
+    :param throughput: the recent throughput in bytes/s, None if unknown
+    :param slow_throughput: below this throughput (kB/s), JPEG without DPI is used
+    :param fast_throughput: above this throughput (kB/s), PNG at full DPI is used, 8 bit PNG in between
+    :return: the image format and the DPI mode
+    """
+    if throughput is None or throughput >= fast_throughput * 1024:
+        return 'png', 7
+    elif throughput < slow_throughput * 1024:
+        return 'jpeg', 0
+    else:
+        return 'png; mode=8bit', 7
+
+
+def force_wms(data, is_background: bool) -> bool:
     """
     Determines if the layer should be forced as WMS (discarding the user preference)
-    :param data:
+    :param data: the SoGroup or SoLayer
     :param is_background:
     :return: True if it should load as WMS
     """
@@ -133,18 +153,9 @@ def force_wms(data: dict, is_background: bool) -> bool:
     return missing_pg_source
 
 
-def missing_postgis_datasource(data: dict):
-    if hasattr(data, 'children'):
-        # is a SoGroup
-        for child in data.children:
-            if missing_postgis_datasource(child):
-                return True
-        return False
-    else:
-        # must be a SoLayer
-        if data.postgis_datasource is None:
-            return True
-        else:
-            return False
-
-
+def missing_postgis_datasource(data) -> bool:
+    """
+    Returns True if the SoLayer or any layer of the SoGroup has no PG data source
+    The flag is computed when the tree is built.
+    """
+    return data.missing_postgis_datasource
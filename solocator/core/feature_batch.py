@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+
+ QGIS Solothurn Locator Plugin
+ Copyright (C) 2019 Denis Rouzaud
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from collections import deque
+
+from qgis.core import Qgis, QgsApplication, QgsVectorLayer, QgsFeature, QgsGeometry, QgsWkbTypes, QgsProject, \
+    QgsRectangle, QgsCoordinateTransform, QgsCoordinateReferenceSystem, QgsCsException
+from qgis.gui import QgisInterface
+
+from solocator.core.feature_store import feature_store
+from solocator.core.feature_task import FeatureGeometryTask, UnsupportedGeometryType
+from solocator.core.network_access_manager import NAM_POOL
+from solocator.core.search_client import HEADERS, feature_request_url
+from solocator.core.settings_snapshot import settings_snapshot
+from solocator.core.utils import info, dbg_info
+
+# maximum number of feature requests in flight
+MAX_CONCURRENT_REQUESTS = 4
+
+FIELDS = 'field=display:string&field=dataproduct_id:string&field=feature_id:string'
+
+
+class FeatureBatch:
+    """
+    Fetches the geometries of several features (stored ones are taken from the feature store),
+    with a limited number of concurrent requests, and shows them in temporary memory layers (points and polygons).
+    The features which could not be fetched are reported once at the end.
+    This runs in the main thread.
+    """
+
+    def __init__(self, iface: QgisInterface, features: list, name: str, finished_callback=None):
+        """
+        :param features: list of (FeatureResult, display string)
+        :param name: the name of the layers
+        :param finished_callback: called with the batch once all the features are handled (not if aborted)
+        """
+        self.iface = iface
+        self.name = name
+        self.finished_callback = finished_callback
+        self.total = len(features)
+        self.failures = 0
+        # the geometry types which are not supported
+        self.unsupported_types = set()
+        self.geometries = []
+        self.queue = deque()
+        self.handles = {}
+        self.tasks = set()
+        self.aborted = False
+        self.snapshot = settings_snapshot()
+
+        store = feature_store()
+        for feature, display in features:
+            geometry = store.get(feature.dataproduct_id, feature.feature_id)
+            if geometry is not None:
+                self.geometries.append((feature, display, geometry))
+            else:
+                self.queue.append((feature, display))
+        dbg_info('batch of {} features, {} from the store'.format(len(features), len(self.geometries)))
+
+    def start(self):
+        if not self.queue:
+            self.finish()
+            return
+        for _ in range(min(MAX_CONCURRENT_REQUESTS, len(self.queue))):
+            self.fetch_next()
+
+    def abort(self):
+        self.aborted = True
+        self.queue.clear()
+        for handle in list(self.handles.values()):
+            handle.abort()
+        self.handles.clear()
+        for task in self.tasks:
+            task.cancel()
+
+    def pending(self) -> int:
+        return len(self.queue) + len(self.handles) + len(self.tasks)
+
+    def fetch_next(self):
+        if self.aborted or not self.queue:
+            return
+        feature, display = self.queue.popleft()
+        url = feature_request_url(self.snapshot, feature.dataproduct_id, feature.feature_id)
+        key = feature.key()
+        self.handles[key] = NAM_POOL.request(
+            url, headers=HEADERS, callback=lambda response: self.parse_response(response, feature, display)
+        )
+
+    def parse_response(self, response, feature, display: str):
+        self.handles.pop(feature.key(), None)
+        if self.aborted:
+            return
+        if response.status_code != 200 or not response.ok:
+            dbg_info('Error in feature response with status code: {} from {}'.format(response.status_code, response.url))
+            self.failures += 1
+            self.fetch_next()
+            self.finish_if_done()
+            return
+        task = FeatureGeometryTask(
+            response.content, None, lambda task: self.geometry_finished(task, feature, display),
+            'SoLocator: {}'.format(feature)
+        )
+        self.tasks.add(task)
+        QgsApplication.taskManager().addTask(task)
+        # the next request is sent while the geometry is being built
+        self.fetch_next()
+
+    def geometry_finished(self, task: FeatureGeometryTask, feature, display: str):
+        self.tasks.discard(task)
+        if self.aborted:
+            return
+        if isinstance(task.error, UnsupportedGeometryType):
+            self.unsupported_types.add(task.error.geometry_type)
+            self.failures += 1
+        elif task.error is not None:
+            dbg_info('Error in feature response of {}: {}'.format(feature, task.error))
+            self.failures += 1
+        if task.geometry is not None:
+            feature_store().put(feature.dataproduct_id, feature.feature_id, task.geometry)
+            self.geometries.append((feature, display, task.geometry))
+        self.finish_if_done()
+
+    def finish_if_done(self):
+        if not self.aborted and self.pending() == 0:
+            self.finish()
+
+    def finish(self):
+        """
+        Adds the geometries to memory layers, zooms to their extent and reports the failures
+        """
+        self.report_failures()
+        if self.finished_callback is not None:
+            self.finished_callback(self)
+        if not self.geometries:
+            return
+        layers = {}
+        extent = QgsRectangle()
+        extent.setMinimal()
+        for feature, display, geometry in self.geometries:
+            if geometry.type() == QgsWkbTypes.GeometryType.PointGeometry:
+                layer_key, uri = 'point', 'Point'
+            else:
+                layer_key, uri = 'polygon', 'MultiPolygon'
+                geometry = QgsGeometry(geometry)
+                geometry.convertToMultiType()
+            if layer_key not in layers:
+                layers[layer_key] = QgsVectorLayer(
+                    '{}?crs=EPSG:2056&{}&index=yes'.format(uri, FIELDS), self.name, 'memory'
+                )
+            layer = layers[layer_key]
+            qgs_feature = QgsFeature(layer.fields())
+            qgs_feature.setAttributes([display, feature.dataproduct_id, str(feature.feature_id)])
+            qgs_feature.setGeometry(geometry)
+            layer.dataProvider().addFeature(qgs_feature)
+            extent.combineExtentWith(geometry.boundingBox())
+
+        for layer in layers.values():
+            layer.updateExtents()
+            QgsProject.instance().addMapLayer(layer)
+
+        self.zoom_to(extent)
+
+    def report_failures(self):
+        if self.unsupported_types:
+            info('SoLocator unterstützt den Geometrietyp {geometry_type} nicht.'.format(
+                geometry_type=', '.join(sorted(self.unsupported_types))), Qgis.MessageLevel.Warning)
+        if self.failures:
+            # {failures} of {total} places could not be loaded
+            info('{} von {} Orten konnten nicht geladen werden.'.format(self.failures, self.total),
+                 Qgis.MessageLevel.Warning)
+
+    def zoom_to(self, extent: QgsRectangle):
+        canvas = self.iface.mapCanvas()
+        transform = QgsCoordinateTransform(
+            QgsCoordinateReferenceSystem('EPSG:2056'), canvas.mapSettings().destinationCrs(), QgsProject.instance()
+        )
+        try:
+            extent = transform.transformBoundingBox(extent)
+        except QgsCsException:
+            return
+        if extent.width() == 0 and extent.height() == 0:
+            canvas.setCenter(extent.center())
+            canvas.zoomScale(self.snapshot.point_scale)
+        else:
+            extent.scale(1.1)
+            canvas.setExtent(extent)
+        canvas.refresh()
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+
+ QGIS Solothurn Locator Plugin
+ Copyright (C) 2019 Denis Rouzaud
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+import time
+
+from osgeo import ogr, osr
+
+from qgis.PyQt.QtCore import QTimer
+from qgis.core import QgsGeometry
+
+from solocator.core.metrics import METRICS
+from solocator.core.settings import Settings
+from solocator.core.utils import local_file_path, dbg_info
+
+FILE_NAME = 'features.gpkg'
+LAYER_NAME = 'features'
+# eviction is run when the store is opened and then every EVICTION_INTERVAL insertions
+EVICTION_INTERVAL = 100
+# the insertions are synced to disk after this delay (ms), grouping the insertions of a batch
+SYNC_DELAY = 2000
+
+
+def quote(value: str) -> str:
+    return "'{}'".format(str(value).replace("'", "''"))
+
+
+class FeatureStore:
+    """
+    A local GeoPackage of the fetched feature geometries, stored in EPSG:2056 with a spatial index.
+    Features are identified by their data product and feature ID.
+    Entries older than the setting feature_store_max_age (days) are ignored and evicted,
+    the amount of entries is capped by the setting feature_store_max_entries.
+    This should only be used in the main thread.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.settings = Settings()
+        self.data_source = None
+        self.insertions = 0
+        self.sync_timer = QTimer()
+        self.sync_timer.setSingleShot(True)
+        self.sync_timer.setInterval(SYNC_DELAY)
+        self.sync_timer.timeout.connect(self.sync)
+
+    def layer(self) -> ogr.Layer:
+        if self.data_source is None:
+            if os.path.exists(self.path):
+                self.data_source = ogr.Open(self.path, update=1)
+            else:
+                self.data_source = ogr.GetDriverByName('GPKG').CreateDataSource(self.path)
+            if self.data_source.GetLayerByName(LAYER_NAME) is None:
+                srs = osr.SpatialReference()
+                srs.ImportFromEPSG(2056)
+                layer = self.data_source.CreateLayer(LAYER_NAME, srs, ogr.wkbUnknown, ['SPATIAL_INDEX=YES'])
+                layer.CreateField(ogr.FieldDefn('dataproduct_id', ogr.OFTString))
+                layer.CreateField(ogr.FieldDefn('feature_id', ogr.OFTString))
+                layer.CreateField(ogr.FieldDefn('fetched_at', ogr.OFTInteger64))
+                self.data_source.ExecuteSQL(
+                    'CREATE UNIQUE INDEX IF NOT EXISTS {layer}_id_idx ON {layer} (dataproduct_id, feature_id)'.format(layer=LAYER_NAME)
+                )
+            self.evict()
+        return self.data_source.GetLayerByName(LAYER_NAME)
+
+    def min_fetched_at(self) -> int:
+        # at least one day, 0 would make every entry outdated
+        return int(time.time()) - max(1, self.settings.value('feature_store_max_age')) * 86400
+
+    def get(self, dataproduct_id: str, feature_id) -> QgsGeometry:
+        """
+        Returns the stored geometry (in EPSG:2056) or None if the feature is not stored or outdated
+        """
+        layer = self.layer()
+        layer.SetAttributeFilter('dataproduct_id = {} AND feature_id = {} AND fetched_at >= {}'.format(
+            quote(dataproduct_id), quote(feature_id), self.min_fetched_at()
+        ))
+        feature = layer.GetNextFeature()
+        layer.SetAttributeFilter(None)
+        found = feature is not None and feature.GetGeometryRef() is not None
+        METRICS.record_cache('feature_store', found)
+        if not found:
+            return None
+        geometry = QgsGeometry()
+        geometry.fromWkb(bytes(feature.GetGeometryRef().ExportToIsoWkb()))
+        return geometry
+
+    def put(self, dataproduct_id: str, feature_id, geometry: QgsGeometry):
+        """
+        Stores (or replaces) the geometry of a feature
+        :param geometry: the geometry in EPSG:2056
+        """
+        if geometry.isNull() or geometry.isEmpty():
+            return
+        layer = self.layer()
+        self.data_source.ExecuteSQL('DELETE FROM {layer} WHERE dataproduct_id = {dp} AND feature_id = {id}'.format(
+            layer=LAYER_NAME, dp=quote(dataproduct_id), id=quote(feature_id)
+        ))
+        feature = ogr.Feature(layer.GetLayerDefn())
+        feature.SetField('dataproduct_id', dataproduct_id)
+        feature.SetField('feature_id', str(feature_id))
+        feature.SetField('fetched_at', int(time.time()))
+        feature.SetGeometry(ogr.CreateGeometryFromWkb(bytes(geometry.asWkb())))
+        layer.CreateFeature(feature)
+        if not self.sync_timer.isActive():
+            self.sync_timer.start()
+
+        self.insertions += 1
+        if self.insertions % EVICTION_INTERVAL == 0:
+            self.evict()
+
+    def evict(self):
+        """
+        Removes outdated entries and the oldest ones above the maximum number of entries
+        """
+        self.data_source.ExecuteSQL('DELETE FROM {layer} WHERE fetched_at < {min}'.format(
+            layer=LAYER_NAME, min=self.min_fetched_at()
+        ))
+        self.data_source.ExecuteSQL(
+            'DELETE FROM {layer} WHERE fid IN (SELECT fid FROM {layer} ORDER BY fetched_at DESC LIMIT -1 OFFSET {max})'.format(
+                layer=LAYER_NAME, max=self.settings.value('feature_store_max_entries')
+            )
+        )
+        dbg_info('feature store evicted')
+
+    def sync(self):
+        if self.data_source is not None:
+            self.data_source.GetLayerByName(LAYER_NAME).SyncToDisk()
+
+    def close(self):
+        self.sync_timer.stop()
+        self.sync()
+        self.data_source = None
+
+
+_feature_store = None
+
+
+def feature_store() -> FeatureStore:
+    """
+    Returns the feature store, shared in the main thread
+    """
+    global _feature_store
+    if _feature_store is None:
+        _feature_store = FeatureStore(local_file_path(FILE_NAME))
+    return _feature_store
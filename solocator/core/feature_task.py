@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+
+ QGIS Solothurn Locator Plugin
+ Copyright (C) 2019 Denis Rouzaud
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from qgis.core import QgsTask, QgsGeometry, QgsPointXY, QgsCoordinateTransform, QgsCsException
+
+from solocator.core.json_decoder import loads
+
+FEATURE_CRS = 'urn:ogc:def:crs:EPSG::2056'
+
+
+class UnsupportedGeometryType(Exception):
+    def __init__(self, geometry_type: str):
+        super().__init__(geometry_type)
+        self.geometry_type = geometry_type
+
+
+def geometry_from_feature_data(data: dict) -> QgsGeometry:
+    """
+    Builds the geometry of a feature returned by the feature service (GeoJSON in EPSG:2056)
+    :raises UnsupportedGeometryType: if the geometry type is not handled
+    """
+    assert data['crs']['properties']['name'] == FEATURE_CRS
+
+    geometry_type = data['geometry']['type']
+
+    if geometry_type.lower() == 'point':
+        return QgsGeometry.fromPointXY(QgsPointXY(data['geometry']['coordinates'][0],
+                                                  data['geometry']['coordinates'][1]))
+
+    elif geometry_type.lower() == 'polygon':
+        rings = data['geometry']['coordinates']
+        for r in range(0, len(rings)):
+            for p in range(0, len(rings[r])):
+                rings[r][p] = QgsPointXY(rings[r][p][0], rings[r][p][1])
+        return QgsGeometry.fromPolygonXY(rings)
+
+    elif geometry_type.lower() == 'multipolygon':
+        islands = data['geometry']['coordinates']
+        for i in range(0, len(islands)):
+            for r in range(0, len(islands[i])):
+                for p in range(0, len(islands[i][r])):
+                    islands[i][r][p] = QgsPointXY(islands[i][r][p][0], islands[i][r][p][1])
+        return QgsGeometry.fromMultiPolygonXY(islands)
+
+    raise UnsupportedGeometryType(geometry_type)
+
+
+class FeatureGeometryTask(QgsTask):
+    """
+    Decodes a feature response, builds its geometry and transforms it to the canvas CRS in a background thread.
+    The callback is called on the main thread with the finished task,
+    which then holds the geometry in EPSG:2056 (geometry) and in the canvas CRS (transformed_geometry).
+    """
+
+    def __init__(self, content, transform: QgsCoordinateTransform, callback, description: str = 'SoLocator'):
+        """
+        :param content: the content of the response
+        :param transform: the transformation to the canvas CRS, None to skip the transformation
+        :param callback: called on the main thread with the task once it has finished (successfully or not)
+        """
+        super().__init__(description, QgsTask.Flag.CanCancel)
+        # the content is copied so the response can be released
+        self.content = bytes(content)
+        self.transform = QgsCoordinateTransform(transform) if transform is not None else None
+        self.callback = callback
+        self.geometry = None
+        self.transformed_geometry = None
+        self.error = None
+
+    def run(self) -> bool:
+        try:
+            data = loads(self.content)
+            self.content = None
+            if self.isCanceled():
+                return False
+            self.geometry = geometry_from_feature_data(data)
+            if self.isCanceled():
+                return False
+            if self.transform is not None:
+                self.transformed_geometry = QgsGeometry(self.geometry)
+                self.transformed_geometry.transform(self.transform)
+            return True
+        except (UnsupportedGeometryType, ValueError, KeyError, TypeError, AssertionError, QgsCsException) as e:
+            self.error = e
+        return False
+
+    def finished(self, result: bool):
+        self.callback(self)
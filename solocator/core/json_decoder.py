@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+
+ QGIS Solothurn Locator Plugin
+ Copyright (C) 2019 Denis Rouzaud
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import json
+
+from qgis.PyQt.QtCore import QByteArray
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def buffer(content):
+    """
+    Returns a view on the content without copying it if possible
+    :param content: QByteArray, bytes or str
+    """
+    if isinstance(content, QByteArray):
+        try:
+            return memoryview(content)
+        except TypeError:
+            # the buffer protocol is not supported by this PyQt version
+            return content.data()
+    return content
+
+
+def loads(content):
+    """
+    Decodes JSON directly from the response content.
+    orjson is used if it is installed, the standard library otherwise.
+    :param content: QByteArray, bytes or str
+    """
+    content = buffer(content)
+    if orjson is not None:
+        return orjson.loads(content)
+    if isinstance(content, memoryview):
+        # the standard library does not read from buffers
+        content = content.tobytes()
+    return json.loads(content)
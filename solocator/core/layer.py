@@ -17,6 +17,7 @@
  ***************************************************************************/
 """
 
+import json
 from copy import deepcopy
 from tempfile import NamedTemporaryFile
 
@@ -27,21 +28,32 @@ from qgis.core import Qgis, QgsVectorLayer, QgsRasterLayer, QgsProject, QgsDataS
 
 from solocator.core.loading_mode import LoadingMode
 from solocator.core.loading_options import LoadingOptions
-from solocator.core.settings import PG_HOST, PG_PORT, PG_DB
+from solocator.core.settings import PG_PORT, PG_DB, pg_host
 from solocator.core.data_products import FACADE_LAYER, image_format_force_jpeg
-from solocator.core.utils import info
+from solocator.core.table_statistics import estimate_table_statistics, prefetch_table_statistics, choose_loading_mode, \
+    max_visible_scale
+from solocator.core.snapshot import PG_SOURCE_PROPERTY
+from solocator.core.utils import info, dbg_info
 
 DEBUG = True
 
 
-def postgis_datasource_to_uri(postgis_datasource: dict, pg_auth_id: str, pg_service: str) -> QgsDataSourceUri:
+def postgis_table_uri(postgis_datasource: dict, pg_auth_id: str, pg_service: str) -> QgsDataSourceUri:
+    """
+    Returns the URI of the connection and table of the data source only
+    """
     uri = QgsDataSourceUri()
     if not pg_service:
-        uri.setConnection(PG_HOST, PG_PORT, PG_DB, None, None, QgsDataSourceUri.SslMode.SslPrefer, pg_auth_id)
+        uri.setConnection(pg_host(), PG_PORT, PG_DB, None, None, QgsDataSourceUri.SslMode.SslPrefer, pg_auth_id)
     else:
         uri.setConnection(pg_service, None, None, None, QgsDataSourceUri.SslMode.SslPrefer, pg_auth_id)
     [schema, table_name] = postgis_datasource['data_set_name'].split('.')
     uri.setDataSource(schema, table_name, postgis_datasource['geometry_field'])
+    return uri
+
+
+def postgis_datasource_to_uri(postgis_datasource: dict, pg_auth_id: str, pg_service: str) -> QgsDataSourceUri:
+    uri = postgis_table_uri(postgis_datasource, pg_auth_id, pg_service)
     uri.setKeyColumn(postgis_datasource['primary_key'])
     wkb_type = None
     if postgis_datasource['geometry_type'].upper() == 'POINT':
@@ -66,23 +78,60 @@ def postgis_datasource_to_uri(postgis_datasource: dict, pg_auth_id: str, pg_serv
     return uri
 
 
-def wms_datasource_to_url(wms_datasource: dict, crs: str, image_format: str) -> str:
+def wms_datasource_to_url(wms_datasource: dict, crs: str, image_format: str, dpi_mode: int = 7) -> str:
     url = "contextualWMSLegend=0&" \
           "crs={crs}&" \
-          "dpiMode=7&" \
+          "dpiMode={dpi_mode}&" \
           "featureCount=10&" \
           "format=image/{image_format}&" \
           "layers={layer}&" \
           "styles&" \
           "url={url}".format(
-        crs=crs, image_format=image_format, layer=wms_datasource['name'], url=wms_datasource['service_url']
+        crs=crs, dpi_mode=dpi_mode, image_format=image_format, layer=wms_datasource['name'], url=wms_datasource['service_url']
+    )
+    return url
+
+
+def wmts_datasource_to_url(wms_datasource: dict, crs: str, image_format: str, wmts_url: str, tile_matrix_set: str) -> str:
+    """
+    Returns the URL to load the layer of a WMS data source as tiles from the WMTS,
+    tiles are cached by QGIS and panning over known areas will not hit the network.
+    """
+    url = "contextualWMSLegend=0&" \
+          "crs={crs}&" \
+          "dpiMode=7&" \
+          "featureCount=10&" \
+          "format=image/{image_format}&" \
+          "layers={layer}&" \
+          "styles=default&" \
+          "tileMatrixSet={tile_matrix_set}&" \
+          "url={url}".format(
+        crs=crs, image_format=image_format, layer=wms_datasource['name'], tile_matrix_set=tile_matrix_set, url=wmts_url
     )
     return url
 
 
+class LazyQml:
+    """
+    A QML style kept as the raw (escaped) JSON string from the data product, decoded only when needed
+    """
+    def __init__(self, raw):
+        self.raw = raw
+
+    def __bool__(self):
+        return len(self.raw) > 0
+
+    def __deepcopy__(self, memo):
+        # immutable
+        return self
+
+    def text(self) -> str:
+        return json.loads(b'"' + bytes(self.raw) + b'"')
+
+
 class SoLayer:
     def __init__(self, name: str, is_background: bool, crs: str, wms_datasource: dict, postgis_datasource: dict, description: str,
-                 qml: str = None):
+                 qml=None):
         self.name = name
         self.is_background = is_background
         self.crs = crs
@@ -94,20 +143,43 @@ class SoLayer:
             postgis_datasource = postgis_datasource[0]
         self.wms_datasource = wms_datasource
         self.postgis_datasource = postgis_datasource
+        # str or LazyQml
         self.qml = qml
+        self.missing_postgis_datasource = postgis_datasource is None
 
     def __repr__(self):
         return 'SoLayer: {}'.format(self.name)
 
-    def load(self, insertion_point: QgsLayerTreeRegistryBridge.InsertionPoint, loading_options: LoadingOptions) -> bool:
+    def qml_text(self) -> str:
+        if isinstance(self.qml, LazyQml):
+            return self.qml.text()
+        return self.qml
+
+    def load(self, insertion_point: QgsLayerTreeRegistryBridge.InsertionPoint, loading_options: LoadingOptions,
+             project: QgsProject = None) -> bool:
+        """
+        :param project: the project to add the layer to, defaults to the current project
+        """
         layer = None
-        if self.postgis_datasource is not None and loading_options.loading_mode == LoadingMode.PG:
+        if self.postgis_datasource is not None and loading_options.loading_mode in (LoadingMode.PG, LoadingMode.AUTO):
             uri = postgis_datasource_to_uri(self.postgis_datasource, loading_options.pg_auth_id, loading_options.pg_service)
+            min_scale = 0
+            if uri and loading_options.loading_mode == LoadingMode.AUTO:
+                statistics = estimate_table_statistics(uri)
+                loading_mode = choose_loading_mode(statistics, loading_options.visible_extent, loading_options.auto_max_features)
+                dbg_info('automatic loading mode for {}: {}'.format(self.name, loading_mode))
+                if loading_mode != LoadingMode.PG:
+                    uri = None
+                else:
+                    min_scale = max_visible_scale(statistics, loading_options.visible_extent,
+                                                  loading_options.visible_scale, loading_options.auto_max_features)
             if uri:
                 layer = QgsVectorLayer(uri.uri(False), self.name, "postgres")
+                # allows to snapshot the layer to a local GeoPackage
+                layer.setCustomProperty(PG_SOURCE_PROPERTY, uri.uri(False))
                 if layer.isValid() and self.qml:
                     with NamedTemporaryFile(mode='w', suffix='.qml', delete=False, encoding='utf-8') as fh:
-                        fh.write(self.qml)
+                        fh.write(self.qml_text())
                         fh.close()
                         msg, ok = layer.loadNamedStyle(fh.name)
                         if not ok:
@@ -116,14 +188,28 @@ class SoLayer:
                                 .format(ln=self.name, emsg=msg, uri=uri.uri(False)),
                                 Qgis.MessageLevel.Warning
                             )
+                if min_scale and not (layer.hasScaleBasedVisibility() and 0 < layer.minimumScale() <= min_scale):
+                    # large table: hidden when zoomed out (unless the style already limits it further)
+                    dbg_info('{} is only visible up to 1:{:.0f}'.format(self.name, min_scale))
+                    layer.setMinimumScale(min_scale)
+                    layer.setScaleBasedVisibility(True)
         if layer is None:
             if image_format_force_jpeg(self.name, self.is_background):
                 img_format = 'jpeg'
             else:
                 img_format = loading_options.wms_image_format
-            url = wms_datasource_to_url(self.wms_datasource, self.crs, img_format)
+            if self.is_background and loading_options.background_tiled:
+                url = wmts_datasource_to_url(
+                    self.wms_datasource, self.crs, img_format, loading_options.wmts_url, loading_options.wmts_tile_matrix_set
+                )
+                layer = QgsRasterLayer(url, self.name, 'wms')
+                if not layer.isValid():
+                    dbg_info('layer {} is not available from the WMTS, loading from WMS'.format(self.name))
+                    layer = None
+        if layer is None:
+            url = wms_datasource_to_url(self.wms_datasource, self.crs, img_format, loading_options.wms_dpi_mode)
             layer = QgsRasterLayer(url, self.name, 'wms')
-        QgsProject.instance().addMapLayer(layer, False)
+        (project or QgsProject.instance()).addMapLayer(layer, False)
         if not layer.isValid():
             info('Layer {} konnte nicht korrekt geladen werden.'.format(self.name), Qgis.MessageLevel.Warning)
             return False
@@ -134,6 +220,11 @@ class SoLayer:
                 insertion_point.group.addLayer(layer)
             return True
 
+    def postgis_table_uris(self, loading_options: LoadingOptions) -> list:
+        if self.postgis_datasource is None:
+            return []
+        return [postgis_table_uri(self.postgis_datasource, loading_options.pg_auth_id, loading_options.pg_service)]
+
     def tree_widget_item(self):
         item = QTreeWidgetItem([self.name])
         item.setData(0, Qt.ItemDataRole.UserRole, deepcopy(self))
@@ -146,30 +237,41 @@ class SoGroup:
         self.children = children
         self.layer = layer
         self.type = _type
+        self.missing_postgis_datasource = any(child.missing_postgis_datasource for child in children)
 
     def __repr__(self):
         return 'SoGroup: {} ( {} )'.format(self.name, ','.join([child.__repr__() for child in self.children]))
 
-    def load(self, insertion_point: QgsLayerTreeRegistryBridge.InsertionPoint, loading_options: LoadingOptions):
+    def load(self, insertion_point: QgsLayerTreeRegistryBridge.InsertionPoint, loading_options: LoadingOptions,
+             project: QgsProject = None):
         """
         Loads group in the layer tree
         :param insertion_point: The insertion point in the layer tree (group + position)
         :param load_options: the configuration to load layers
+        :param project: the project to add the layers to, defaults to the current project (in which case a wait cursor is shown)
         """
-        QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
-        if loading_options.loading_mode != LoadingMode.PG \
+        if project is None:
+            QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
+        if loading_options.loading_mode == LoadingMode.WMS \
                 and self.layer.wms_datasource is not None \
                 and (not loading_options.wms_load_separate or self.type == FACADE_LAYER):
-            self.layer.load(insertion_point, loading_options)
+            self.layer.load(insertion_point, loading_options, project)
         else:
             if insertion_point.position >= 0:
                 group = insertion_point.group.insertGroup(insertion_point.position, self.name)
             else:
                 group = insertion_point.group.addGroup(self.name)
 
+            if loading_options.loading_mode == LoadingMode.AUTO:
+                # the statistics of all the tables in one query rather than one per layer (cached for nested groups)
+                prefetch_table_statistics(self.postgis_table_uris(loading_options))
             for i, child in enumerate(self.children):
-                child.load(QgsLayerTreeRegistryBridge.InsertionPoint(group, i), loading_options)
-        QApplication.restoreOverrideCursor()
+                child.load(QgsLayerTreeRegistryBridge.InsertionPoint(group, i), loading_options, project)
+        if project is None:
+            QApplication.restoreOverrideCursor()
+
+    def postgis_table_uris(self, loading_options: LoadingOptions) -> list:
+        return [uri for child in self.children for uri in child.postgis_table_uris(loading_options)]
 
     def tree_widget_item(self):
         item = QTreeWidgetItem([self.name])
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+
+ QGIS Solothurn Locator Plugin
+ Copyright (C) 2019 Denis Rouzaud
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import json
+import os
+import threading
+import time
+from collections import Counter
+
+from solocator.core.utils import local_file_path, dbg_info
+
+FILE_NAME = 'layer_catalog.json'
+# minimum similarity (0 to 1) of the trigrams of a name and of the search
+MIN_SIMILARITY = 0.3
+# entries not returned by the search service for this number of days are removed
+MAX_AGE_DAYS = 30
+
+
+def today() -> int:
+    # days since the epoch, entries are marked as seen once a day at most so that the index is not rebuilt on every search
+    return int(time.time() // 86400)
+
+
+def trigrams(text: str) -> set:
+    """
+    Returns the trigrams of the normalized text, padded so that short words and word starts are matched
+    """
+    text = '  {} '.format(' '.join(text.lower().split()))
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class TrigramIndex:
+    """
+    An immutable trigram index over the names of the catalog entries, for typo tolerant matching
+    """
+
+    def __init__(self, entries: dict):
+        """
+        :param entries: the catalog entries by data product ID
+        """
+        self.ids = []
+        self.sizes = []
+        self.postings = {}
+        for _id, entry in entries.items():
+            grams = trigrams(entry['display'])
+            index = len(self.ids)
+            self.ids.append(_id)
+            self.sizes.append(len(grams))
+            for gram in grams:
+                self.postings.setdefault(gram, []).append(index)
+
+    def search(self, text: str, limit: int) -> list:
+        """
+        :return: the IDs of the best matching entries
+        """
+        grams = trigrams(text)
+        if not grams:
+            return []
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.postings.get(gram, ()))
+        scored = []
+        for index, count in shared.items():
+            # Dice coefficient
+            similarity = 2 * count / (len(grams) + self.sizes[index])
+            if similarity >= MIN_SIMILARITY:
+                scored.append((similarity, index))
+        scored.sort(key=lambda item: -item[0])
+        return [self.ids[index] for _, index in scored[:limit]]
+
+
+class LayerCatalog:
+    """
+    A local catalog of the map layers (data products and their sublayers), harvested from the search responses.
+    Map layers are then found locally, the trigram index being rebuilt in a background thread when the catalog changes.
+    Entries are removed when they have not been returned by the search service for MAX_AGE_DAYS
+    or when their data product cannot be found anymore.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        entries = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, encoding='utf-8') as fh:
+                    entries = json.load(fh)
+            except (OSError, ValueError) as e:
+                dbg_info('could not read layer catalog: {}'.format(e))
+        for entry in entries.values():
+            # entries from previous versions have no date, they are kept for MAX_AGE_DAYS
+            entry.setdefault('seen', today())
+        entries = self.unexpired(entries)
+        # entries and their index, replaced together
+        self.state = (entries, TrigramIndex(entries))
+        # the entries waiting for their index to be built, None if the index is up to date
+        self.pending_entries = None
+
+    @staticmethod
+    def unexpired(entries: dict) -> dict:
+        oldest = today() - MAX_AGE_DAYS
+        return {_id: entry for _id, entry in entries.items() if entry['seen'] >= oldest}
+
+    def get(self, dataproduct_id: str) -> dict:
+        return self.state[0].get(dataproduct_id)
+
+    def search(self, text: str, limit: int) -> list:
+        """
+        :return: the matching entries, a group being followed by its sublayers
+        """
+        entries, index = self.state
+        found = []
+        seen = set()
+        for _id in index.search(text, limit):
+            for child_id in [_id] + entries[_id].get('sublayers', []):
+                if child_id not in seen and child_id in entries:
+                    seen.add(child_id)
+                    found.append(entries[child_id])
+        return found
+
+    def harvest(self, results: list):
+        """
+        Adds the data products of a search response (with their sublayers) and rebuilds the index if changed
+        :param results: the results of a search response
+        """
+        seen = today()
+        with self.lock:
+            current = self.pending_entries if self.pending_entries is not None else self.state[0]
+            entries = self.unexpired(dict(current))
+            changed = len(entries) != len(current)
+            for res in results:
+                dp = res.get('dataproduct')
+                if dp is None:
+                    continue
+                sublayers = dp.get('sublayers') or []
+                for data, parent in [(dp, None)] + [(layer, dp['dataproduct_id']) for layer in sublayers]:
+                    entry = {
+                        'dataproduct_id': data['dataproduct_id'],
+                        'display': data['display'],
+                        'type': data['type'],
+                        'dset_info': data.get('dset_info'),
+                        'stacktype': dp['stacktype'],
+                        'parent': parent,
+                        'sublayers': [layer['dataproduct_id'] for layer in data.get('sublayers') or []],
+                        'seen': seen
+                    }
+                    if entries.get(entry['dataproduct_id']) != entry:
+                        entries[entry['dataproduct_id']] = entry
+                        changed = True
+            if not changed:
+                return
+            start = self.replace_entries(entries)
+        if start:
+            threading.Thread(target=self.rebuild, daemon=True).start()
+
+    def remove(self, dataproduct_id: str):
+        """
+        Removes a data product which cannot be found anymore (its sublayers are removed on their own)
+        """
+        with self.lock:
+            current = self.pending_entries if self.pending_entries is not None else self.state[0]
+            if dataproduct_id not in current:
+                return
+            entries = dict(current)
+            del entries[dataproduct_id]
+            start = self.replace_entries(entries)
+        dbg_info('{} removed from the layer catalog'.format(dataproduct_id))
+        if start:
+            threading.Thread(target=self.rebuild, daemon=True).start()
+
+    def replace_entries(self, entries: dict) -> bool:
+        """
+        Must be called with the lock acquired, readers use the previous entries until the new index is ready
+        :return: True if the index must be rebuilt, False if a rebuild is already running (and will start again)
+        """
+        start = self.pending_entries is None
+        self.pending_entries = entries
+        return start
+
+    def rebuild(self):
+        with self.lock:
+            entries = self.pending_entries
+        index = TrigramIndex(entries)
+        with self.lock:
+            if self.pending_entries is not entries:
+                # changed again while building
+                threading.Thread(target=self.rebuild, daemon=True).start()
+            else:
+                self.pending_entries = None
+            self.state = (entries, index)
+        self.save(entries)
+        dbg_info('layer catalog index rebuilt with {} entries'.format(len(entries)))
+
+    def save(self, entries: dict):
+        try:
+            tmp_path = '{}.{}.tmp'.format(self.path, threading.get_ident())
+            with open(tmp_path, 'w', encoding='utf-8') as fh:
+                json.dump(entries, fh)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            dbg_info('could not write layer catalog: {}'.format(e))
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def layer_catalog() -> LayerCatalog:
+    """
+    Returns the layer catalog shared by all filter instances
+    """
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = LayerCatalog(local_file_path(FILE_NAME))
+        return _catalog
@@ -17,42 +17,92 @@
  ***************************************************************************/
 """
 
-from qgis.core import QgsLayerTreeRegistryBridge, QgsProject
+from qgis.core import QgsLayerTreeRegistryBridge, QgsProject, QgsNetworkAccessManager, QgsCoordinateTransform, \
+    QgsCoordinateReferenceSystem, QgsCsException
 from qgis.gui import QgisInterface
 
-from solocator.core.layer import SoLayer, SoGroup
 from solocator.core.loading_options import LoadingOptions
 from solocator.core.loading_mode import LoadingMode
-from solocator.core.data_products import LAYER_GROUP, FACADE_LAYER, force_wms
+from solocator.core.data_products import force_wms, adaptive_image_format
+from solocator.core.network_access_manager import TRANSFER_STATISTICS
+from solocator.core.profiling import profiled
 from solocator.core.utils import dbg_info
-from solocator.core.settings import Settings, PG_SERVICE
+from solocator.core.settings import Settings, pg_service, wmts_url
 
 DEFAULT_CRS = 'EPSG:2056'
 
 
-class LayerLoader:
-    def __init__(self, data: dict, iface: QgisInterface, is_background: bool, alternate_mode: bool = False):
+def ensure_tile_cache_size(size_mb: int):
+    """
+    Makes sure the network disk cache of QGIS (where tiles are stored) is at least of the given size
+    """
+    cache = QgsNetworkAccessManager.instance().cache()
+    if cache is None or not hasattr(cache, 'setMaximumCacheSize'):
+        return
+    size = size_mb * 1024 * 1024
+    if cache.maximumCacheSize() < size:
+        dbg_info('increasing network cache size to {} MB'.format(size_mb))
+        cache.setMaximumCacheSize(size)
+
+
+def resolve_loading_mode(data, is_background: bool, loading_mode: LoadingMode) -> LoadingMode:
+    """
+    Returns the loading mode to use for the data product
+    :param data: the SoGroup or SoLayer
+    :param loading_mode: the requested loading mode
+    """
+    # in automatic mode, layers without PG data source are loaded as WMS individually
+    if (loading_mode != LoadingMode.AUTO or is_background) and force_wms(data, is_background):
+        return LoadingMode.WMS
+    return loading_mode
+
+
+def loading_options_from_settings(settings: Settings, loading_mode: LoadingMode, visible_extent=None,
+                                  visible_scale: float = None) -> LoadingOptions:
+    """
+    Returns the loading options from the plugin settings
+    :param visible_extent: in automatic mode, the visible extent (EPSG:2056)
+    :param visible_scale: in automatic mode, the scale of the map canvas
+    """
+    wms_image_format = settings.value('wms_image_format')
+    wms_dpi_mode = 7
+    if wms_image_format == 'auto':
+        throughput = TRANSFER_STATISTICS.recent_throughput()
+        wms_image_format, wms_dpi_mode = adaptive_image_format(
+            throughput, settings.value('adaptive_slow_throughput'), settings.value('adaptive_fast_throughput')
+        )
+        dbg_info('adaptive WMS format for throughput {} B/s: {} (dpiMode={})'.format(throughput, wms_image_format, wms_dpi_mode))
+
+    return LoadingOptions(
+        wms_load_separate=settings.value('wms_load_separate'),
+        wms_image_format=wms_image_format,
+        wms_dpi_mode=wms_dpi_mode,
+        loading_mode=loading_mode,
+        pg_auth_id=settings.value('pg_auth_id'),
+        pg_service=pg_service(settings),
+        background_tiled=settings.value('background_tiled'),
+        wmts_url=wmts_url(settings),
+        wmts_tile_matrix_set=settings.value('wmts_tile_matrix_set'),
+        auto_max_features=settings.value('auto_max_features'),
+        visible_extent=visible_extent,
+        visible_scale=visible_scale
+    )
 
-        # debug
-        for i, v in data.items():
-            if i in ('qml', 'contacts'): continue
-            if i == 'sublayers':
-                for sublayer in data['sublayers']:
-                    for j, u in sublayer.items():
-                        if j in ('qml', 'contacts'): continue
-                        dbg_info('*** sublayer {}: {}'.format(j, u))
-            else:
-                dbg_info('*** {}: {}'.format(i, v))
 
-        data = self.reformat_data(data, is_background)
+class LayerLoader:
+    @profiled('layer_loading')
+    def __init__(self, data, iface: QgisInterface, is_background: bool, alternate_mode: bool = False):
+        """
+        Loads a data product in the layer tree
+        :param data: the SoGroup or SoLayer, see data_product_parser.parse_data_product
+        """
+        dbg_info(data)
 
         settings = Settings()
         loading_mode: LoadingMode = settings.value('default_layer_loading_mode')
         if alternate_mode:
             loading_mode = loading_mode.alternate_mode()
-
-        if force_wms(data, is_background):
-            loading_mode = LoadingMode.WMS
+        loading_mode = resolve_loading_mode(data, is_background, loading_mode)
 
         # if background, insert at bottom of layer tree
         if is_background:
@@ -65,29 +115,28 @@ class LayerLoader:
 
         dbg_info("insertion point: {} {}".format(insertion_point.group.name(), insertion_point.position))
 
-        loading_options = LoadingOptions(
-            wms_load_separate=settings.value('wms_load_separate'),
-            wms_image_format=settings.value('wms_image_format'),
-            loading_mode=loading_mode,
-            pg_auth_id=settings.value('pg_auth_id'),
-            pg_service=PG_SERVICE
-        )
+        if loading_mode == LoadingMode.AUTO:
+            loading_options = loading_options_from_settings(
+                settings, loading_mode, self.visible_extent(iface), iface.mapCanvas().scale()
+            )
+        else:
+            loading_options = loading_options_from_settings(settings, loading_mode)
+
+        if is_background and loading_options.background_tiled:
+            ensure_tile_cache_size(settings.value('tile_cache_size'))
 
         data.load(insertion_point, loading_options)
 
-    def reformat_data(self, data: dict, is_background: bool):
+    @staticmethod
+    def visible_extent(iface: QgisInterface):
         """
-        Recursive construction of the tree
-        :param data:
-        :param is_background:
+        Returns the extent of the map canvas in EPSG:2056
         """
-        crs = data.get('crs', DEFAULT_CRS)
-        if data['type'] in (LAYER_GROUP, FACADE_LAYER):
-            children = [self.reformat_data(child_data, is_background) for child_data in data['sublayers']]
-            group_layer = SoLayer(data['display'], is_background, crs, data['wms_datasource'], data.get('postgis_datasource'), data.get('description'), data.get('qml'))
-            return SoGroup(data['display'], children, group_layer, data['type'])
-        else:
-            dbg_info(data.keys())
-            return SoLayer(data['display'], is_background,  crs,
-                           data['wms_datasource'], data.get('postgis_datasource'),
-                           data.get('description'), data.get('qml'))
+        canvas = iface.mapCanvas()
+        transform = QgsCoordinateTransform(
+            canvas.mapSettings().destinationCrs(), QgsCoordinateReferenceSystem(DEFAULT_CRS), QgsProject.instance()
+        )
+        try:
+            return transform.transformBoundingBox(canvas.extent())
+        except QgsCsException:
+            return None
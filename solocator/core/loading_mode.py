@@ -4,12 +4,16 @@ from enum import Enum
 class LoadingMode(Enum):
     PG = 1
     WMS = 2
+    # chosen per layer from the estimated size of the table
+    AUTO = 3
 
     def __str__(self):
         if self.value == LoadingMode.PG.value:
             return 'PostgreSQL'
         elif self.value == LoadingMode.WMS.value:
             return 'WMS'
+        elif self.value == LoadingMode.AUTO.value:
+            return 'Automatisch'
         else:
             return self.name
 
@@ -18,5 +22,7 @@ class LoadingMode(Enum):
             return LoadingMode.WMS
         elif self.value == LoadingMode.WMS.value:
             return LoadingMode.PG
+        elif self.value == LoadingMode.AUTO.value:
+            return LoadingMode.WMS
         else:
             raise NameError('incomplete handling of enum values')
\ No newline at end of file
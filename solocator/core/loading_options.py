@@ -1,3 +1,5 @@
+from qgis.core import QgsRectangle
+
 from solocator.core.loading_mode import LoadingMode
 
 
@@ -6,16 +8,33 @@ class LoadingOptions:
     A class to hold the loading options
     """
     def __init__(self, wms_load_separate: bool, wms_image_format: str,
-                 loading_mode: LoadingMode, pg_auth_id: str = None, pg_service: str = None):
+                 loading_mode: LoadingMode, pg_auth_id: str = None, pg_service: str = None,
+                 background_tiled: bool = False, wmts_url: str = None, wmts_tile_matrix_set: str = None,
+                 wms_dpi_mode: int = 7, auto_max_features: int = None, visible_extent: QgsRectangle = None,
+                 visible_scale: float = None):
         """
         :param wms_load_separate: If True, individual layers will be loaded as separate instead of a single one
         :param wms_image_format: image format
-        :param loading_mode: the LoadingMode (WMS or PostgreSQL)
+        :param loading_mode: the LoadingMode (WMS, PostgreSQL or automatic)
         :param pg_auth_id: the configuration ID for the authentification
         :param pg_service: the PG service nate
+        :param background_tiled: If True, background layers are loaded from the WMTS
+        :param wmts_url: the URL of the WMTS capabilities
+        :param wmts_tile_matrix_set: the tile matrix set of the WMTS
+        :param wms_dpi_mode: the DPI mode of the WMS provider (0: off, 7: all)
+        :param auto_max_features: in automatic mode, the maximum number of visible features to load from PostgreSQL
+        :param visible_extent: in automatic mode, the visible extent (EPSG:2056) to estimate the number of visible features
+        :param visible_scale: in automatic mode, the scale of the visible extent, to limit the visibility of the large tables
         """
         self.loading_mode = loading_mode
         self.wms_load_separate = wms_load_separate
         self.pg_auth_id = pg_auth_id
         self.pg_service = pg_service
-        self.wms_image_format = wms_image_format
\ No newline at end of file
+        self.wms_image_format = wms_image_format
+        self.background_tiled = background_tiled
+        self.wmts_url = wmts_url
+        self.wmts_tile_matrix_set = wmts_tile_matrix_set
+        self.wms_dpi_mode = wms_dpi_mode
+        self.auto_max_features = auto_max_features
+        self.visible_extent = visible_extent
+        self.visible_scale = visible_scale
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+
+ QGIS Solothurn Locator Plugin
+ Copyright (C) 2019 Denis Rouzaud
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import bisect
+import json
+import os
+import re
+import threading
+import time
+
+from qgis.PyQt.QtCore import QTimer
+
+from solocator.core.settings import Settings
+from solocator.core.utils import local_file_path, dbg_info
+
+# upper bounds of the latency histogram buckets (seconds), the last bucket is +Inf
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+ENDPOINT_REGEX = re.compile(r'/(search|dataproduct|data)/v\d')
+
+JSON_FILE_NAME = 'metrics.json'
+PROMETHEUS_FILE_NAME = 'metrics.prom'
+
+
+def endpoint(url: str) -> str:
+    """
+    Returns the API endpoint (search, data, dataproduct) of a URL, other for any other URL
+    """
+    match = ENDPOINT_REGEX.search(url or '')
+    return match.group(1) if match else 'other'
+
+
+class EndpointMetrics:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.aborts = 0
+        self.bytes_received = 0
+        self.bytes_decoded = 0
+        # one more bucket for +Inf
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'timeouts': self.timeouts,
+            'aborts': self.aborts,
+            'bytes_received': self.bytes_received,
+            'bytes_decoded': self.bytes_decoded,
+            'latency_buckets': dict(zip([str(b) for b in LATENCY_BUCKETS] + ['+Inf'], self.latency_buckets)),
+            'latency_sum': round(self.latency_sum, 3)
+        }
+
+
+class Metrics:
+    """
+    Session metrics: requests per endpoint (counts, bytes, errors, latency histogram) and cache hit rates.
+    Recording only increments counters under a lock, so it can be called from any thread in the hot paths.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.endpoints = {}
+        # cache name: [hits, misses]
+        self.caches = {}
+
+    def record_request(self, url: str, elapsed: float, bytes_received: int = 0, bytes_decoded: int = 0,
+                       error: bool = False, timeout: bool = False, aborted: bool = False):
+        """
+        :param elapsed: the duration of the request in seconds, None if unknown
+        """
+        name = endpoint(url)
+        with self.lock:
+            metrics = self.endpoints.get(name)
+            if metrics is None:
+                metrics = self.endpoints[name] = EndpointMetrics()
+            metrics.requests += 1
+            metrics.errors += error
+            metrics.timeouts += timeout
+            metrics.aborts += aborted
+            metrics.bytes_received += bytes_received
+            metrics.bytes_decoded += bytes_decoded
+            if elapsed is not None and not aborted:
+                metrics.latency_buckets[bisect.bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+                metrics.latency_sum += elapsed
+
+    def record_cache(self, cache: str, hit: bool):
+        with self.lock:
+            counts = self.caches.get(cache)
+            if counts is None:
+                counts = self.caches[cache] = [0, 0]
+            counts[0 if hit else 1] += 1
+
+    def as_dict(self) -> dict:
+        with self.lock:
+            return {
+                'started': int(self.started),
+                'updated': int(time.time()),
+                'endpoints': {name: metrics.as_dict() for name, metrics in self.endpoints.items()},
+                'caches': {
+                    name: {'hits': hits, 'misses': misses, 'hit_rate': round(hits / (hits + misses), 3)}
+                    for name, (hits, misses) in self.caches.items()
+                }
+            }
+
+    def as_prometheus(self) -> str:
+        """
+        Returns the metrics in the Prometheus text exposition format
+        """
+        data = self.as_dict()
+        lines = [
+            '# TYPE solocator_session_start_seconds gauge',
+            'solocator_session_start_seconds {}'.format(data['started'])
+        ]
+        for metric, key in (('requests', 'requests'), ('request_errors', 'errors'), ('request_timeouts', 'timeouts'),
+                            ('request_aborts', 'aborts'), ('received_bytes', 'bytes_received'),
+                            ('decoded_bytes', 'bytes_decoded')):
+            lines.append('# TYPE solocator_{}_total counter'.format(metric))
+            for name, metrics in data['endpoints'].items():
+                lines.append('solocator_{}_total{{endpoint="{}"}} {}'.format(metric, name, metrics[key]))
+        lines.append('# TYPE solocator_request_duration_seconds histogram')
+        for name, metrics in data['endpoints'].items():
+            cumulated = 0
+            for bound, count in metrics['latency_buckets'].items():
+                cumulated += count
+                lines.append('solocator_request_duration_seconds_bucket{{endpoint="{}",le="{}"}} {}'.format(
+                    name, bound, cumulated
+                ))
+            lines.append('solocator_request_duration_seconds_sum{{endpoint="{}"}} {}'.format(name, metrics['latency_sum']))
+            lines.append('solocator_request_duration_seconds_count{{endpoint="{}"}} {}'.format(name, cumulated))
+        for metric in ('hits', 'misses'):
+            lines.append('# TYPE solocator_cache_{}_total counter'.format(metric))
+            for name, counts in data['caches'].items():
+                lines.append('solocator_cache_{}_total{{cache="{}"}} {}'.format(metric, name, counts[metric]))
+        return '\n'.join(lines) + '\n'
+
+    def write(self, directory: str):
+        """
+        Writes the metrics as JSON and Prometheus text files (replaced atomically)
+        """
+        for file_name, content in ((JSON_FILE_NAME, json.dumps(self.as_dict(), indent=1)),
+                                   (PROMETHEUS_FILE_NAME, self.as_prometheus())):
+            path = os.path.join(directory, file_name)
+            tmp_path = '{}.tmp'.format(path)
+            with open(tmp_path, 'w', encoding='utf-8') as fh:
+                fh.write(content)
+            os.replace(tmp_path, path)
+
+
+METRICS = Metrics()
+
+
+class MetricsWriter:
+    """
+    Writes the session metrics regularly (setting metrics_interval, in seconds) to the directory given
+    by the setting metrics_directory (defaults to the SoLocator folder of the QGIS profile).
+    Runs in the main thread.
+    """
+
+    def __init__(self):
+        self.directory = None
+        self.timer = None
+        self.reload()
+
+    def reload(self):
+        """
+        Reads the settings and restarts the timer, must be called when they have changed
+        """
+        settings = Settings()
+        self.directory = settings.value('metrics_directory') or os.path.dirname(local_file_path(JSON_FILE_NAME))
+        if self.timer is not None:
+            self.timer.stop()
+            self.timer = None
+        interval = settings.value('metrics_interval')
+        if interval > 0:
+            self.timer = QTimer()
+            self.timer.timeout.connect(self.write)
+            self.timer.start(interval * 1000)
+
+    def write(self):
+        try:
+            METRICS.write(self.directory)
+        except OSError as e:
+            dbg_info('could not write metrics: {}'.format(e))
+
+    def stop(self):
+        if self.timer is not None:
+            self.timer.stop()
+            self.timer = None
+            # the last state of the session
+            self.write()
+
+
+_writer = None
+
+
+def init_metrics_writer():
+    """
+    Creates the metrics writer or restarts it if it was stopped, must be called in the main thread
+    """
+    global _writer
+    if _writer is None:
+        _writer = MetricsWriter()
+    else:
+        _writer.reload()
+
+
+def metrics_writer() -> MetricsWriter:
+    """
+    Returns the metrics writer, None if it was not created (e.g. running without interface)
+    """
+    return _writer
@@ -20,16 +20,32 @@
 """
 from builtins import str
 import re
+import threading
+import time
+import zlib
 import urllib.request, urllib.error, urllib.parse
+from contextlib import contextmanager
 
-from qgis.PyQt.QtCore import QObject, pyqtSignal, QUrl, QEventLoop
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from qgis.PyQt.QtCore import QObject, pyqtSignal, QUrl, QEventLoop, QThread, QCoreApplication, QTimer
 from qgis.PyQt.QtNetwork import QNetworkRequest, QNetworkReply
 
 from qgis.core import QgsNetworkAccessManager, QgsAuthManager, QgsMessageLog
 
-# FIXME: ignored
+from solocator.core.json_decoder import buffer, loads
+from solocator.core.metrics import METRICS
+
 DEFAULT_MAX_REDIRECTS = 4
 
+ACCEPT_ENCODING = b'gzip, deflate, br' if brotli is not None else b'gzip, deflate'
+
+# interval at which a waiter of a request in flight checks if it has landed (ms)
+FLIGHT_WAIT_INTERVAL = 20
+
 class RequestsException(Exception):
     pass
 
@@ -77,7 +93,78 @@ class Map(dict):
 
 
 class Response(Map):
-    pass
+    def json(self):
+        """
+        Returns the decoded JSON content. It is decoded once and shared by all the users of the response,
+        so it must not be modified.
+        """
+        if self.json_content is None:
+            self.json_content = loads(self.content)
+        return self.json_content
+
+
+def decode_content(content: bytes, encoding: str) -> bytes:
+    """
+    Decodes a compressed response content
+    :param content: the content as received (any bytes-like object)
+    :param encoding: the value of the Content-Encoding header
+    """
+    encoding = encoding.strip().lower()
+    if encoding in ('gzip', 'x-gzip'):
+        return zlib.decompress(content, 16 + zlib.MAX_WBITS)
+    elif encoding == 'deflate':
+        try:
+            return zlib.decompress(content)
+        except zlib.error:
+            # some servers send raw deflate data without zlib header
+            return zlib.decompress(content, -zlib.MAX_WBITS)
+    elif encoding == 'br' and brotli is not None:
+        return brotli.decompress(content)
+    return content
+
+
+class TransferStatistics:
+    """
+    Counts the bytes received over the network (compressed) and after decoding, for all requests.
+    It also keeps a moving average of the throughput of the recent requests.
+    """
+    # smaller responses are dominated by latency and do not tell much about the throughput
+    THROUGHPUT_MIN_BYTES = 32 * 1024
+    # weight of the last request in the moving average
+    THROUGHPUT_SMOOTHING = 0.3
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytes_received = 0
+        self.bytes_decoded = 0
+        self.throughput = None
+
+    def add(self, bytes_received: int, bytes_decoded: int, elapsed: float = None):
+        with self.lock:
+            self.requests += 1
+            self.bytes_received += bytes_received
+            self.bytes_decoded += bytes_decoded
+            if elapsed and bytes_received >= self.THROUGHPUT_MIN_BYTES:
+                throughput = bytes_received / elapsed
+                if self.throughput is None:
+                    self.throughput = throughput
+                else:
+                    self.throughput += self.THROUGHPUT_SMOOTHING * (throughput - self.throughput)
+
+    def recent_throughput(self) -> float:
+        """
+        Returns the average throughput of the recent requests in bytes per second, None if unknown
+        """
+        with self.lock:
+            return self.throughput
+
+    def compression_ratio(self) -> float:
+        with self.lock:
+            return self.bytes_decoded / self.bytes_received if self.bytes_received else 1.0
+
+
+TRANSFER_STATISTICS = TransferStatistics()
 
 
 class NetworkAccessManager(QObject):
@@ -120,7 +207,7 @@ class NetworkAccessManager(QObject):
             'status' - http code result come from reply.attribute(QNetworkRequest.HttpStatusCodeAttribute)
             'status_code' - http code result come from reply.attribute(QNetworkRequest.HttpStatusCodeAttribute)
             'status_message' - reply message string from reply.attribute(QNetworkRequest.HttpReasonPhraseAttribute)
-            'content' - bytearray returned from reply
+            'content' - QByteArray (or bytes if the content was compressed) returned from reply
             'ok' - request success [True, False]
             'headers' - Dicionary containing the reply header
             'reason' - fomatted message string with reply.errorString()
@@ -128,17 +215,31 @@ class NetworkAccessManager(QObject):
     """
 
     finished = pyqtSignal(Response)
+    # can be emitted from any thread to abort the request in the thread of the client
+    abort_requested = pyqtSignal()
 
-    def __init__(self, authid=None, disable_ssl_certificate_validation=False, exception_class=None, debug=False):
+    def __init__(self, authid=None, disable_ssl_certificate_validation=False, exception_class=None, debug=False,
+                 compression=True):
         QObject.__init__(self)
+        self.compression = compression
         self.disable_ssl_certificate_validation = disable_ssl_certificate_validation
         self.authid = authid
         self.reply = None
         self.debug = debug
+        self.custom_exception_class = exception_class
         self.exception_class = exception_class
         self.on_abort = False
         self.blocking_mode = False
-        self.http_call_result = Response({
+        self.el = None
+        self.request_started = None
+        self.request_headers = None
+        self.redirections = DEFAULT_MAX_REDIRECTS
+        self.http_call_result = self.new_result()
+        self.abort_requested.connect(self.abort)
+
+    @staticmethod
+    def new_result():
+        return Response({
             'status': 0,
             'status_code': 0,
             'status_message': '',
@@ -147,9 +248,24 @@ class NetworkAccessManager(QObject):
             'headers': {},
             'reason': '',
             'exception': None,
-            'url': ''
+            'url': '',
+            'bytes_received': 0,
+            'bytes_decoded': 0,
+            'json_content': None
         })
 
+    def reset(self):
+        """
+        Aborts any running request and disconnects the listeners, so the client can be reused
+        """
+        self.abort()
+        try:
+            self.finished.disconnect()
+        except TypeError:
+            # no connection
+            pass
+        self.http_call_result = self.new_result()
+
     def msg_log(self, msg):
         if self.debug:
             QgsMessageLog.logMessage(msg, "NetworkAccessManager")
@@ -161,8 +277,14 @@ class NetworkAccessManager(QObject):
                 connection_type=None, blocking=True):
         """
         Make a network request by calling QgsNetworkAccessManager.
-        redirections argument is ignored and is here only for httplib2 compatibility.
+        redirections is the maximum number of redirections followed.
         """
+        # a new result for each request, the previous one might still be used by a listener
+        self.http_call_result = self.new_result()
+        self.request_started = time.monotonic()
+        self.request_headers = headers
+        self.redirections = redirections
+        self.exception_class = self.custom_exception_class
         self.http_call_result.url = url
         self.msg_log(u'http_call request: {0}'.format(url))
 
@@ -172,19 +294,18 @@ class NetworkAccessManager(QObject):
         url = urllib.parse.unquote(url)
         req.setUrl(QUrl(url))
         if headers is not None:
-            # This fixes a weird error with compressed content not being correctly
-            # inflated.
-            # If you set the header on the QNetworkRequest you are basically telling
-            # QNetworkAccessManager "I know what I'm doing, please don't do any content
-            # encoding processing".
-            # See: https://bugs.webkit.org/show_bug.cgi?id=63696#c1
-            try:
-                del headers['Accept-Encoding']
-            except KeyError:
-                pass
             for k, v in list(headers.items()):
+                if k.lower() in (b'accept-encoding', 'accept-encoding'):
+                    # the encoding is negotiated below
+                    continue
                 self.msg_log("Setting header %s to %s" % (k, v))
                 req.setRawHeader(k, v)
+        if self.compression:
+            # If you set the header on the QNetworkRequest you are basically telling
+            # QNetworkAccessManager "I know what I'm doing, please don't do any content
+            # encoding processing". See: https://bugs.webkit.org/show_bug.cgi?id=63696#c1
+            # The content is therefore decoded in replyFinished, which allows counting the transferred bytes.
+            req.setRawHeader(b'Accept-Encoding', ACCEPT_ENCODING)
         if self.authid:
             self.msg_log("Update request w/ authid: {0}".format(self.authid))
             QgsAuthManager.instance().updateNetworkRequest(req, self.authid)
@@ -224,9 +345,10 @@ class NetworkAccessManager(QObject):
         if not self.blocking_mode:
             return None, None
 
-        # Call and block
-        self.el = QEventLoop()
-        self.reply.finished.connect(self.el.quit)
+        # Call and block, until the final reply (after redirections) has finished
+        if self.el is None:
+            self.el = QEventLoop()
+        self.finished.connect(self.el.quit)
 
         # Catch all exceptions (and clean up requests)
         try:
@@ -234,8 +356,7 @@ class NetworkAccessManager(QObject):
         except Exception as e:
             raise e
 
-        if self.reply:
-            self.reply.finished.disconnect(self.el.quit)
+        self.finished.disconnect(self.el.quit)
 
         # emit exception in case of error
         if not self.http_call_result.ok:
@@ -324,9 +445,14 @@ class NetworkAccessManager(QObject):
                     self.reply.url().toString(), redirection_url.toString())
                 self.msg_log(msg)
 
-                self.reply.deleteLater()
-                self.reply = None
-                self.request(redirection_url.toString())
+                if self.redirections > 0:
+                    # finished is emitted once the final reply has arrived
+                    self.follow_redirection(redirection_url.toString())
+                    return
+                msg = "Too many redirections, last to '{}'".format(redirection_url.toString())
+                self.http_call_result.reason = msg
+                self.http_call_result.ok = False
+                self.http_call_result.exception = (self.exception_class or RequestsException)(msg)
 
             # really end request
             else:
@@ -334,9 +460,28 @@ class NetworkAccessManager(QObject):
                 self.http_call_result.reason = msg
                 self.msg_log(msg)
 
-                ba = self.reply.readAll()
-                self.http_call_result.content = bytes(ba)
-                self.http_call_result.ok = True
+                # the content is kept in the reply buffer (QByteArray) to avoid copies, see json_decoder.loads
+                content = self.reply.readAll()
+                bytes_received = len(content)
+                content_encoding = bytes(self.reply.rawHeader(b'Content-Encoding')).decode('latin-1')
+                decode_error = None
+                if content_encoding:
+                    try:
+                        content = decode_content(buffer(content), content_encoding)
+                    except Exception as e:  # zlib or brotli error
+                        decode_error = "Could not decode {} content: {}".format(content_encoding, e)
+                        self.msg_log(decode_error)
+                self.http_call_result.bytes_received = bytes_received
+                if decode_error is None:
+                    self.http_call_result.content = content
+                    self.http_call_result.bytes_decoded = len(content)
+                    TRANSFER_STATISTICS.add(bytes_received, len(content), time.monotonic() - self.request_started)
+                    self.http_call_result.ok = True
+                else:
+                    # the compressed content must not be given to the callers
+                    self.http_call_result.reason = decode_error
+                    self.http_call_result.ok = False
+                    self.http_call_result.exception = (self.exception_class or RequestsException)(decode_error)
 
         # Let's log the whole response for debugging purposes:
         self.msg_log("Got response %s %s from %s" % \
@@ -350,7 +495,30 @@ class NetworkAccessManager(QObject):
         else:
             self.msg_log("Payload is > 1 KB ...")
 
-        # clean reply
+        self.release_reply()
+
+        aborted = isinstance(self.http_call_result.exception, RequestsExceptionUserAbort)
+        METRICS.record_request(
+            self.http_call_result.url,
+            time.monotonic() - self.request_started if self.request_started is not None else None,
+            self.http_call_result.bytes_received, self.http_call_result.bytes_decoded,
+            error=not self.http_call_result.ok and not aborted,
+            timeout=isinstance(self.http_call_result.exception, RequestsExceptionTimeout),
+            aborted=aborted
+        )
+
+        self.finished.emit(self.http_call_result)
+
+    def release_reply(self):
+        """
+        Disconnects and deletes the finished reply
+        """
+        # the connection is only needed while the request is running
+        try:
+            QgsNetworkAccessManager.instance().requestTimedOut.disconnect(self.requestTimedOut)
+        except TypeError:
+            pass
+
         if self.reply is not None:
             if self.reply.isRunning():
                 self.reply.close()
@@ -364,7 +532,17 @@ class NetworkAccessManager(QObject):
         else:
             self.msg_log("Reply was already deleted ...")
 
-        self.finished.emit(self.http_call_result)
+    def follow_redirection(self, url: str):
+        """
+        Requests the redirection target in place of the finished reply.
+        A blocking request keeps waiting, since its event loop quits on finished.
+        """
+        self.release_reply()
+        started, blocking, redirections = self.request_started, self.blocking_mode, self.redirections
+        self.request(url, headers=self.request_headers, redirections=redirections - 1, blocking=False)
+        # the latency is measured from the first request
+        self.request_started = started
+        self.blocking_mode = blocking
 
     #@pyqtSlot()
     def sslErrors(self, ssl_errors):
@@ -386,3 +564,297 @@ class NetworkAccessManager(QObject):
         if self.reply and self.reply.isRunning():
             self.on_abort = True
             self.reply.abort()
+
+
+class Flight:
+    """
+    A request in flight, shared by all the identical requests made while it runs
+    """
+    def __init__(self, key, blocking: bool):
+        self.key = key
+        self.blocking = blocking
+        self.thread = threading.get_ident()
+        self.nam = None
+        # number of waiters which have not canceled, the request is aborted when it drops to 0
+        self.waiters = 1
+        # callbacks of the non blocking waiters, always called in the thread of the flight
+        self.callbacks = []
+        self.done = threading.Event()
+        self.response = None
+        self.exception = None
+        # the last waiter left before the request was sent, it is aborted as soon as it is
+        self.abort_pending = False
+        # the blocking leader was canceled and left, the remaining waiters make the request again
+        self.abandoned = False
+
+
+class FlightHandle:
+    """
+    The handle of a non blocking request, used to cancel it
+    """
+    def __init__(self, pool, flight: Flight, callback):
+        self.pool = pool
+        self.flight = flight
+        self.callback = callback
+
+    def abort(self):
+        """
+        Cancels the request for this waiter, its callback will not be called anymore.
+        The request itself is aborted once all its waiters have canceled.
+        """
+        self.pool.leave(self.flight, self.callback)
+
+
+class NetworkAccessManagerPool:
+    """
+    A pool of NetworkAccessManager, so clients are reused instead of being created for every request.
+    Since QObjects belong to the thread they were created in, only the clients of the main thread are reused.
+    The other threads (locator searches, executors) are short-lived and often have no event loop,
+    their clients are deleted right after the request.
+
+    Identical requests (same URL and headers) made while one is in flight are not sent again (single-flight):
+    they wait for the running one and get the same response.
+    Usage (blocking mode)
+    -----
+    ::
+        (response, content) = NAM_POOL.fetch('http://www.example.com', feedback=feedback)
+    Usage (non blocking mode)
+    -----
+    ::
+        handle = NAM_POOL.request('http://www.example.com', callback=a_listener)
+        # handle.abort() cancels the request
+    Usage (dedicated client, no deduplication)
+    -----
+    ::
+        with NAM_POOL.client() as nam:
+            (response, content) = nam.request('http://www.example.com')
+    """
+
+    def __init__(self, max_idle: int = 4):
+        self.max_idle = max_idle
+        self.idle = []
+        self.flights = {}
+        self.flights_lock = threading.Lock()
+
+    @staticmethod
+    def in_main_thread() -> bool:
+        app = QCoreApplication.instance()
+        return app is not None and QThread.currentThread() == app.thread()
+
+    def acquire(self) -> NetworkAccessManager:
+        if self.in_main_thread() and self.idle:
+            return self.idle.pop()
+        return NetworkAccessManager()
+
+    def release(self, nam: NetworkAccessManager):
+        nam.reset()
+        if self.in_main_thread() and len(self.idle) < self.max_idle:
+            self.idle.append(nam)
+        # otherwise, the client has no parent and is deleted with its last reference, in its own thread
+        # (deleteLater would never run in a thread without event loop)
+
+    @contextmanager
+    def client(self):
+        nam = self.acquire()
+        try:
+            yield nam
+        finally:
+            self.release(nam)
+
+    @staticmethod
+    def flight_key(url, headers):
+        return url, tuple(sorted((headers or {}).items()))
+
+    def join(self, url, headers, callback=None) -> (Flight, bool):
+        """
+        Joins the identical request in flight, or starts a new flight
+        Non blocking waiters only join non blocking flights of their own thread, since their callback is called there.
+        Blocking waiters only join flights of other threads: in the thread of the flight, they could wait in a nested
+        event loop of the leader, which cannot land before they return.
+        :param callback: the callback of a non blocking waiter, None for a blocking one
+        :return: the flight and True if a new flight was started (the caller has to run it)
+        """
+        key = self.flight_key(url, headers)
+        blocking = callback is None
+        with self.flights_lock:
+            flight = self.flights.get(key)
+            same_thread = flight is not None and flight.thread == threading.get_ident()
+            if flight is not None and (not same_thread if blocking else same_thread and not flight.blocking):
+                flight.waiters += 1
+                leader = False
+                METRICS.record_cache('single_flight', True)
+            else:
+                METRICS.record_cache('single_flight', False)
+                flight = Flight(key, blocking)
+                self.flights[key] = flight
+                leader = True
+            if callback is not None:
+                flight.callbacks.append(callback)
+            return flight, leader
+
+    def leave(self, flight: Flight, callback=None):
+        """
+        Cancels a waiter of the flight, the request is aborted if no waiter is left
+        """
+        with self.flights_lock:
+            if flight.done.is_set():
+                return
+            if callback is not None:
+                try:
+                    flight.callbacks.remove(callback)
+                except ValueError:
+                    # already left
+                    return
+            flight.waiters -= 1
+            abort = flight.waiters <= 0 and flight.nam is not None
+            if flight.waiters <= 0 and flight.nam is None:
+                flight.abort_pending = True
+        if abort:
+            flight.nam.abort_requested.emit()
+
+    def board(self, flight: Flight, nam: NetworkAccessManager):
+        """
+        Sets the client running the flight, the request must be sent before
+        """
+        with self.flights_lock:
+            flight.nam = nam
+            abort = flight.abort_pending
+        if abort:
+            nam.abort_requested.emit()
+
+    def land(self, flight: Flight, response, exception=None) -> list:
+        """
+        Ends the flight
+        :return: the callbacks of the remaining non blocking waiters
+        """
+        with self.flights_lock:
+            if flight.done.is_set():
+                # abandoned by its leader, the reply of the aborted request is ignored
+                return []
+            if self.flights.get(flight.key) is flight:
+                del self.flights[flight.key]
+            flight.response = response
+            flight.exception = exception
+            callbacks = list(flight.callbacks)
+            flight.callbacks.clear()
+            flight.done.set()
+        return callbacks
+
+    @staticmethod
+    def wait(flight: Flight, feedback=None, nam: NetworkAccessManager = None):
+        """
+        Waits for the flight to land (or for the feedback to be canceled) in a local event loop,
+        so that the events of this thread are still processed
+        :param nam: the client running the flight in this thread (leader), the loop quits as soon as it has finished
+        """
+        if flight.done.is_set():
+            return
+        loop = QEventLoop()
+        timer = QTimer()
+
+        def check():
+            if flight.done.is_set() or (feedback is not None and feedback.isCanceled()):
+                loop.quit()
+
+        timer.timeout.connect(check)
+        timer.start(FLIGHT_WAIT_INTERVAL)
+        if nam is not None:
+            nam.finished.connect(check)
+        loop.exec(QEventLoop.ProcessEventsFlag.ExcludeUserInputEvents)
+        timer.stop()
+        if nam is not None:
+            try:
+                nam.finished.disconnect(check)
+            except TypeError:
+                # disconnected when the client was released
+                pass
+
+    def fetch(self, url, headers=None, feedback=None):
+        """
+        Makes a blocking request, sharing an identical request in flight if any.
+        The leader and the waiters wait in a local event loop and return as soon as the feedback is canceled.
+        :param feedback: a QgsFeedback to cancel the request
+        :return: (response, content), raises as NetworkAccessManager.request
+        """
+        flight, leader = self.join(url, headers)
+        canceled = []
+
+        def cancel():
+            if not canceled:
+                canceled.append(True)
+                self.leave(flight)
+
+        if feedback is not None:
+            feedback.canceled.connect(cancel)
+        try:
+            nam = None
+            if leader:
+                nam = self.acquire()
+
+                def finished(response):
+                    exception = None
+                    if not response.ok:
+                        exception = response.exception or RequestsException(response.reason or 'Unknown reason')
+                    self.land(flight, response, exception)
+
+                nam.finished.connect(finished)
+                try:
+                    nam.request(url, headers=headers, blocking=False)
+                except Exception as e:
+                    self.land(flight, nam.httpResult(), e)
+                    self.release(nam)
+                    raise
+                self.board(flight, nam)
+            # waits for the reply, checking the feedback since the request is not aborted if other waiters remain
+            self.wait(flight, feedback, nam)
+            if feedback is not None and feedback.isCanceled():
+                cancel()
+            if leader:
+                if not flight.done.is_set():
+                    # the reply is received in the thread of the leader, which is about to return:
+                    # the remaining waiters make the request again
+                    with self.flights_lock:
+                        flight.abandoned = True
+                    self.land(flight, nam.httpResult(), RequestsExceptionUserAbort('Operation canceled'))
+                # aborts the reply if it is still running
+                self.release(nam)
+        finally:
+            if feedback is not None:
+                feedback.canceled.disconnect(cancel)
+
+        if canceled:
+            raise RequestsExceptionUserAbort('Operation canceled')
+        if flight.abandoned:
+            return self.fetch(url, headers, feedback)
+        if flight.exception is not None:
+            raise flight.exception
+        return flight.response, flight.response.content
+
+    def request(self, url, headers=None, callback=None) -> FlightHandle:
+        """
+        Makes a non blocking request, sharing an identical request in flight if any.
+        The callback is called with the response, its client is released afterwards.
+        :return: the handle of the request, which can be used to abort it while it is running
+        """
+        callback = callback or (lambda response: None)
+        flight, leader = self.join(url, headers, callback)
+        handle = FlightHandle(self, flight, callback)
+        if not leader:
+            return handle
+
+        nam = self.acquire()
+
+        def finished(response):
+            try:
+                for cb in self.land(flight, response):
+                    cb(response)
+            finally:
+                self.release(nam)
+
+        nam.finished.connect(finished)
+        nam.request(url, headers=headers, blocking=False)
+        self.board(flight, nam)
+        return handle
+
+
+NAM_POOL = NetworkAccessManagerPool()
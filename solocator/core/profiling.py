@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+
+ QGIS Solothurn Locator Plugin
+ Copyright (C) 2019 Denis Rouzaud
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import cProfile
+import functools
+import os
+import threading
+import time
+
+from qgis.PyQt.QtCore import QObject, pyqtSignal, pyqtSlot
+
+from solocator.core.settings import Settings
+from solocator.core.utils import local_file_path, dbg_info
+
+DIRECTORY_NAME = 'profiles'
+
+
+def default_profile_directory() -> str:
+    return local_file_path(DIRECTORY_NAME)
+
+
+class Profiler(QObject):
+    """
+    Profiles the next operations with cProfile, as many as given by the setting profile_next_operations.
+    Each operation is written to its own .prof file (see pstats, snakeviz).
+    Only one operation is profiled at a time in the whole process: since Python 3.12, a profile covers all the threads
+    and a second one cannot be enabled. Operations started meanwhile (in any thread) are not profiled on their own.
+    The profiler must be created in the main thread, where the settings are read and written.
+    """
+    # emitted from any thread when an operation is profiled, with the remaining count
+    consumed = pyqtSignal(int)
+
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Lock()
+        self.active = False
+        self.remaining = 0
+        self.directory = None
+        # queued when emitted from another thread
+        self.consumed.connect(self.store_remaining)
+        self.reload()
+
+    def reload(self):
+        """
+        Reads the settings, must be called when they have changed
+        """
+        settings = Settings()
+        with self.lock:
+            self.remaining = settings.value('profile_next_operations')
+            self.directory = settings.value('profile_directory') or default_profile_directory()
+
+    @pyqtSlot(int)
+    def store_remaining(self, remaining: int):
+        # the setting is decremented too, so that profiling stops even if QGIS is restarted
+        Settings().set_value('profile_next_operations', remaining)
+
+    def begin(self) -> cProfile.Profile:
+        """
+        :return: the started profile or None if the operation is not profiled
+        """
+        # not profiling is the usual case, it is checked without lock
+        if self.remaining <= 0 or self.active:
+            return None
+        with self.lock:
+            if self.remaining <= 0 or self.active:
+                return None
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError as e:
+                # another profiler (or debugger) is active
+                dbg_info('could not profile: {}'.format(e))
+                return None
+            self.active = True
+            self.remaining -= 1
+            remaining = self.remaining
+        self.consumed.emit(remaining)
+        return profile
+
+    def end(self, profile: cProfile.Profile, operation: str):
+        profile.disable()
+        with self.lock:
+            self.active = False
+        now = time.time()
+        file_name = '{}-{:03d}-{}-{}.prof'.format(
+            time.strftime('%Y%m%d-%H%M%S', time.localtime(now)), int(now * 1000) % 1000, operation, threading.get_ident()
+        )
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, file_name)
+            profile.dump_stats(path)
+            dbg_info('profile of {} written to {}'.format(operation, path))
+        except OSError as e:
+            dbg_info('could not write profile: {}'.format(e))
+
+
+_profiler = None
+
+
+def init_profiler():
+    """
+    Creates the profiler, must be called in the main thread
+    """
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler()
+
+
+def profiler() -> Profiler:
+    """
+    Returns the profiler shared by all threads, None if it was not created (e.g. running without interface)
+    """
+    return _profiler
+
+
+def profiled(operation: str):
+    """
+    Decorator profiling the function if requested by the settings
+    :param operation: the name of the operation, used in the file name
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            instance = _profiler
+            profile = instance.begin() if instance is not None else None
+            try:
+                return func(*args, **kwargs)
+            finally:
+                if profile is not None:
+                    instance.end(profile, operation)
+        return wrapper
+    return decorator
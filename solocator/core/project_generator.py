@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+
+ QGIS Solothurn Locator Plugin
+ Copyright (C) 2019 Denis Rouzaud
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+Headless generation of QGIS projects from data products, without QGIS interface nor locator.
+
+Usage:
+    python -m solocator.core.project_generator projects.json --output-dir /path/to/projects --workers 8
+
+where projects.json maps the project names to the data products to load (backgrounds are loaded at the bottom):
+    {
+        "gemeinden": {"dataproducts": ["ch.so.agi.gemeindegrenzen"], "backgrounds": ["ch.so.agi.hintergrundkarte_sw"]},
+        "adressen": ["ch.so.agi.av.gebaeudeadressen.gebaeudeeingaenge"]
+    }
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from qgis.core import QgsApplication, QgsProject, QgsCoordinateReferenceSystem, QgsLayerTreeRegistryBridge
+
+from solocator.core.data_product_parser import parse_data_product, DEFAULT_CRS
+from solocator.core.layer_loader import resolve_loading_mode, loading_options_from_settings
+from solocator.core.loading_mode import LoadingMode
+from solocator.core.network_access_manager import NAM_POOL
+from solocator.core.settings import Settings, data_product_url
+from solocator.core.utils import info
+
+HEADERS = {b'User-Agent': b'Mozilla/5.0 QGIS SoLocator Project Generator'}
+
+LOADING_MODES = {'pg': LoadingMode.PG, 'wms': LoadingMode.WMS, 'auto': LoadingMode.AUTO}
+
+# characters not kept in the file names, in particular path separators
+FILE_NAME_REGEX = re.compile(r'[^\w.-]+')
+
+
+class ProjectGenerationError(Exception):
+    pass
+
+
+class ProjectDefinition:
+    def __init__(self, name: str, dataproducts: list, backgrounds: list = None):
+        """
+        :param name: the name of the project, used as title and file name
+        :param dataproducts: the IDs of the data products, in the order of the layer tree
+        :param backgrounds: the IDs of the background data products, loaded at the bottom of the layer tree
+        """
+        self.name = name
+        self.dataproducts = dataproducts
+        self.backgrounds = backgrounds or []
+
+    def __repr__(self):
+        return 'ProjectDefinition: {}'.format(self.name)
+
+    def dataproduct_ids(self) -> list:
+        return self.dataproducts + self.backgrounds
+
+
+def read_project_definitions(path: str) -> list:
+    """
+    Reads the project definitions from a JSON file, see module documentation
+    """
+    with open(path, encoding='utf-8') as fh:
+        content = json.load(fh)
+    definitions = []
+    for name, definition in content.items():
+        if isinstance(definition, list):
+            definitions.append(ProjectDefinition(name, definition))
+        else:
+            definitions.append(ProjectDefinition(name, definition.get('dataproducts', []), definition.get('backgrounds')))
+    return definitions
+
+
+def fetch_data_product(dataproduct_id: str, url: str):
+    """
+    Fetches the data product description (blocking)
+    :return: the content of the response
+    """
+    (response, content) = NAM_POOL.fetch('{url}/{dataproduct_id}'.format(url=url, dataproduct_id=dataproduct_id), HEADERS)
+    if response.status_code != 200 or not response.ok:
+        raise ProjectGenerationError('data product {} could not be fetched: status code {}'.format(
+            dataproduct_id, response.status_code
+        ))
+    return content
+
+
+def fetch_data_products(dataproduct_ids, executor: ThreadPoolExecutor) -> dict:
+    """
+    Fetches the data products concurrently, each of them once
+    :return: a dict of the content (or the exception) by data product ID
+    """
+    url = data_product_url()
+    dataproduct_ids = list(dict.fromkeys(dataproduct_ids))
+    futures = {_id: executor.submit(fetch_data_product, _id, url) for _id in dataproduct_ids}
+    contents = {}
+    for _id, future in futures.items():
+        try:
+            contents[_id] = future.result()
+        except Exception as e:
+            # reported by the projects using the data product
+            contents[_id] = e
+    return contents
+
+
+def project_file_name(name: str) -> str:
+    """
+    Returns the file name of a project, which cannot escape the output directory
+    :param name: the name of the project
+    """
+    file_name = FILE_NAME_REGEX.sub('_', name).strip('.')
+    if not file_name:
+        raise ProjectGenerationError('{}: invalid project name'.format(name))
+    return '{}.qgz'.format(file_name)
+
+
+def build_project(definition: ProjectDefinition, contents: dict, output_dir: str, loading_mode: LoadingMode = None) -> str:
+    """
+    Builds and writes a project
+    :param contents: the contents of the data products, see fetch_data_products
+    :param loading_mode: the loading mode, defaults to the one of the settings
+    :return: the path of the project file
+    """
+    settings = Settings()
+    if loading_mode is None:
+        loading_mode = settings.value('default_layer_loading_mode')
+    path = os.path.join(output_dir, project_file_name(definition.name))
+
+    project = QgsProject()
+    try:
+        project.setTitle(definition.name)
+        project.setCrs(QgsCoordinateReferenceSystem(DEFAULT_CRS))
+        root = project.layerTreeRoot()
+
+        for dataproduct_id in definition.dataproduct_ids():
+            content = contents[dataproduct_id]
+            if isinstance(content, Exception):
+                raise ProjectGenerationError('{}: {}'.format(definition.name, content))
+            is_background = dataproduct_id in definition.backgrounds
+            data = parse_data_product(content, is_background)
+            loading_options = loading_options_from_settings(settings, resolve_loading_mode(data, is_background, loading_mode))
+            # layers are appended, so the backgrounds (last) end at the bottom
+            data.load(QgsLayerTreeRegistryBridge.InsertionPoint(root, len(root.children())), loading_options, project)
+
+        if not project.write(path):
+            raise ProjectGenerationError('{}: {}'.format(definition.name, project.error()))
+    finally:
+        project.clear()
+    return path
+
+
+def generate_projects(definitions: list, output_dir: str, loading_mode: LoadingMode = None, max_workers: int = 8) -> dict:
+    """
+    Generates the projects: the data products are fetched concurrently in a worker pool,
+    then the projects are built and written one after the other in the calling (main) thread,
+    since projects and provider layers must not be created concurrently.
+    A QgsApplication must be running.
+    :param definitions: the list of ProjectDefinition
+    :param output_dir: the directory where the projects are written
+    :param loading_mode: the loading mode, defaults to the one of the settings
+    :param max_workers: the number of worker threads fetching the data products
+    :return: a dict of the path of the project file (or the exception) by project name,
+             the file name is the project name where the characters other than letters, digits, "." and "-" are replaced by "_"
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        contents = fetch_data_products(
+            [_id for definition in definitions for _id in definition.dataproduct_ids()], executor
+        )
+    results = {}
+    for definition in definitions:
+        try:
+            results[definition.name] = build_project(definition, contents, output_dir, loading_mode)
+            info('project {} written to {}'.format(definition.name, results[definition.name]))
+        except ProjectGenerationError as e:
+            info(str(e))
+            results[definition.name] = e
+        except Exception as e:
+            # e.g. an invalid data product, the other projects are still generated
+            info('{}: {}: {}'.format(definition.name, type(e).__name__, e))
+            results[definition.name] = e
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Generates QGIS projects from SoLocator data products')
+    parser.add_argument('definitions', help='JSON file of the project definitions')
+    parser.add_argument('--output-dir', default=os.getcwd(), help='directory where the projects are written')
+    parser.add_argument('--workers', type=int, default=8, help='number of threads fetching the data products')
+    parser.add_argument('--mode', choices=LOADING_MODES.keys(), help='loading mode, defaults to the plugin setting')
+    args = parser.parse_args(argv)
+
+    app = QgsApplication([], False)
+    app.initQgis()
+    # print the log, since there is no interface
+    app.messageLog().messageReceived.connect(lambda message, tag, level: print('{}: {}'.format(tag, message)))
+    try:
+        results = generate_projects(
+            read_project_definitions(args.definitions), args.output_dir, LOADING_MODES.get(args.mode), args.workers
+        )
+    finally:
+        app.exitQgis()
+    failed = [name for name, result in results.items() if isinstance(result, Exception)]
+    print('{} projects written, {} failed {}'.format(len(results) - len(failed), len(failed), ', '.join(failed)))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
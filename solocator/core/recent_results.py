@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+
+ QGIS Solothurn Locator Plugin
+ Copyright (C) 2019 Denis Rouzaud
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+from solocator.core.utils import local_file_path, dbg_info
+from solocator.core.json_decoder import buffer
+
+FILE_NAME = 'recent_results.json'
+# the cached data products are stored in separate files, in this directory
+DATA_PRODUCTS_DIRECTORY = 'recent_dataproducts'
+MAX_ENTRIES = 100
+# cached data products larger than this are not stored (in bytes)
+MAX_CACHED_SIZE = 512 * 1024
+# the weight of an entry is halved after this amount of days
+HALF_LIFE_DAYS = 7
+# changes are saved in the background after this delay (seconds), grouping the changes of several triggers
+SAVE_DELAY = 5
+
+FEATURE = 'feature'
+DATA_PRODUCT = 'dataproduct'
+
+
+def tokenize(text: str) -> list:
+    return re.findall(r'\w+', text.lower())
+
+
+class RecentResults:
+    """
+    A small local store of the results triggered by the user, ranked by frecency (frequency and recency).
+    Entries are plain dictionaries to be stored as JSON:
+        key: unique key of the result
+        kind: FEATURE or DATA_PRODUCT
+        display: the displayed string
+        group: the group of the original result
+        data: the arguments to re-create the user data of the result
+        count: how many times it was triggered
+        last_used: timestamp of the last usage
+        dataproduct: optional file name of the cached JSON content of the data product
+    The store is read from worker threads (search) and written from the main thread (trigger).
+    Changes are saved by a background thread, shortly after they are made.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.directory = os.path.join(os.path.dirname(path), DATA_PRODUCTS_DIRECTORY)
+        self.lock = threading.Lock()
+        self._entries = None
+        # the cached data products not written yet, by key
+        self.pending_dataproducts = {}
+        self.save_timer = None
+
+    @property
+    def entries(self) -> dict:
+        # must be called with the lock acquired
+        if self._entries is None:
+            self._entries = {}
+            if os.path.exists(self.path):
+                try:
+                    with open(self.path, encoding='utf-8') as fh:
+                        self._entries = {entry['key']: entry for entry in json.load(fh)}
+                    for key, entry in self._entries.items():
+                        # data products used to be stored in the entries, they are moved to their files
+                        if entry.get('dataproduct') and not entry['dataproduct'].endswith('.json'):
+                            self.pending_dataproducts[key] = entry['dataproduct']
+                            entry['dataproduct'] = self.dataproduct_file_name(key)
+                except (OSError, ValueError, KeyError) as e:
+                    dbg_info('could not read recent results: {}'.format(e))
+        return self._entries
+
+    @staticmethod
+    def frecency(entry: dict, now: float) -> float:
+        age_days = (now - entry['last_used']) / 86400
+        return entry['count'] * 0.5 ** (age_days / HALF_LIFE_DAYS)
+
+    @staticmethod
+    def dataproduct_file_name(key: str) -> str:
+        return '{}.json'.format(hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def search(self, text: str, limit: int) -> list:
+        """
+        Returns the entries matching the search text, ordered by frecency.
+        Every word of the search text must be the beginning of a word of the entry.
+        """
+        words = tokenize(text)
+        if not words or limit <= 0:
+            return []
+        now = time.time()
+        with self.lock:
+            matches = []
+            for entry in self.entries.values():
+                entry_words = tokenize(entry['display'])
+                if all(any(ew.startswith(w) for ew in entry_words) for w in words):
+                    matches.append(entry)
+            matches.sort(key=lambda e: self.frecency(e, now), reverse=True)
+            return [dict(entry) for entry in matches[:limit]]
+
+    def get(self, key: str) -> dict:
+        with self.lock:
+            entry = self.entries.get(key)
+            return dict(entry) if entry else None
+
+    def dataproduct(self, key: str) -> str:
+        """
+        Returns the cached data product (JSON content) of an entry, None if not cached
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            content = self.pending_dataproducts.get(key)
+            file_name = entry.get('dataproduct') if entry else None
+        if content is not None or not file_name:
+            return content
+        try:
+            with open(os.path.join(self.directory, file_name), encoding='utf-8') as fh:
+                return fh.read()
+        except OSError as e:
+            dbg_info('could not read cached data product: {}'.format(e))
+            return None
+
+    def record(self, key: str, kind: str, display: str, group: str, data: dict):
+        """
+        Records the usage of a result
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = {'key': key, 'kind': kind, 'count': 0, 'dataproduct': None}
+                self.entries[key] = entry
+            entry.update({'display': display, 'group': group, 'data': data, 'last_used': time.time()})
+            entry['count'] += 1
+            if len(self.entries) > MAX_ENTRIES:
+                now = time.time()
+                kept = sorted(self.entries.values(), key=lambda e: self.frecency(e, now), reverse=True)[:MAX_ENTRIES]
+                self._entries = {e['key']: e for e in kept}
+            self.schedule_save()
+
+    def cache(self, key: str, dataproduct):
+        """
+        Caches the data product (JSON content as received) of a recorded entry.
+        Feature geometries are stored in the feature store.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or len(dataproduct) > MAX_CACHED_SIZE:
+                return
+            self.pending_dataproducts[key] = bytes(buffer(dataproduct)).decode('utf-8')
+            entry['dataproduct'] = self.dataproduct_file_name(key)
+            self.schedule_save()
+
+    def schedule_save(self):
+        # must be called with the lock acquired
+        if self.save_timer is None:
+            self.save_timer = threading.Timer(SAVE_DELAY, self.save)
+            self.save_timer.daemon = True
+            self.save_timer.start()
+
+    def flush(self):
+        """
+        Saves the pending changes now (e.g. when the plugin is unloaded)
+        """
+        with self.lock:
+            timer = self.save_timer
+        if timer is not None:
+            timer.cancel()
+            self.save()
+
+    def save(self):
+        with self.lock:
+            self.save_timer = None
+            content = [dict(entry) for entry in self.entries.values()]
+            dataproducts = dict(self.pending_dataproducts)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            for key, dataproduct in dataproducts.items():
+                path = os.path.join(self.directory, self.dataproduct_file_name(key))
+                with open('{}.tmp'.format(path), 'w', encoding='utf-8') as fh:
+                    fh.write(dataproduct)
+                os.replace('{}.tmp'.format(path), path)
+            tmp_path = '{}.tmp'.format(self.path)
+            with open(tmp_path, 'w', encoding='utf-8') as fh:
+                json.dump(content, fh)
+            os.replace(tmp_path, self.path)
+            # the data products of the evicted entries
+            used = {entry['dataproduct'] for entry in content if entry.get('dataproduct')}
+            for file_name in os.listdir(self.directory):
+                if file_name not in used and file_name.endswith('.json'):
+                    os.remove(os.path.join(self.directory, file_name))
+        except OSError as e:
+            dbg_info('could not write recent results: {}'.format(e))
+        with self.lock:
+            for key, dataproduct in dataproducts.items():
+                # unless cached again in the meantime
+                if self.pending_dataproducts.get(key) is dataproduct:
+                    del self.pending_dataproducts[key]
+
+
+_recent_results = None
+_recent_results_lock = threading.Lock()
+
+
+def recent_results() -> RecentResults:
+    """
+    Returns the store of recent results, which is shared by all filter instances
+    """
+    global _recent_results
+    with _recent_results_lock:
+        if _recent_results is None:
+            _recent_results = RecentResults(local_file_path(FILE_NAME))
+        return _recent_results
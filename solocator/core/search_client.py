@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+
+ QGIS Solothurn Locator Plugin
+ Copyright (C) 2019 Denis Rouzaud
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from qgis.PyQt.QtCore import QObject, QUrl, QUrlQuery, pyqtSignal, pyqtSlot
+from qgis.core import QgsFeedback, QgsGeometry
+
+from solocator.core.data_product_catalog import data_product_catalog
+from solocator.core.feature_task import geometry_from_feature_data
+from solocator.core.json_decoder import loads
+from solocator.core.network_access_manager import NAM_POOL, RequestsException
+from solocator.core.settings_snapshot import SettingsSnapshot, settings_snapshot, reload_settings_snapshot
+from solocator.core.utils import dbg_info
+
+HEADERS = {b'User-Agent': b'Mozilla/5.0 QGIS SoLocator Filter'}
+
+
+def url_with_param(url, params) -> str:
+    url = QUrl(url)
+    q = QUrlQuery(url)
+    for key, value in params.items():
+        q.addQueryItem(key, value)
+    url.setQuery(q)
+    return url.url()
+
+
+def search_request_url(snapshot: SettingsSnapshot, search_text: str, dataproducts_filter: str = None, limit: int = None,
+                       filtered: bool = True) -> str:
+    """
+    Returns the URL of the search service
+    :param dataproducts_filter: the data products to search in (comma separated), defaults to the ones of the settings
+    :param limit: the maximum number of results, defaults to the one of the settings
+    :param filtered: if False, all the data products of the service are searched
+    """
+    params = {'searchtext': str(search_text)}
+    if filtered:
+        params['filter'] = dataproducts_filter or snapshot.dataproducts_filter
+    params['limit'] = str(limit or snapshot.results_limit)
+    return url_with_param(snapshot.search_url, params)
+
+
+def feature_request_url(snapshot: SettingsSnapshot, dataproduct_id: str, feature_id) -> str:
+    return '{url}/{dataset}/{id}'.format(url=snapshot.feature_url, dataset=dataproduct_id, id=feature_id)
+
+
+def search(search_text: str, dataproducts_filter: str = None, limit: int = None, feedback: QgsFeedback = None) -> dict:
+    """
+    Searches (blocking), the response is shared with identical searches in flight
+    :return: the decoded response, which must not be modified
+    :raises RequestsException: if the request failed
+    """
+    url = search_request_url(settings_snapshot(), search_text, dataproducts_filter, limit)
+    (response, content) = NAM_POOL.fetch(url, headers=HEADERS, feedback=feedback)
+    if response.status_code != 200 or not response.ok:
+        raise RequestsException('status code {} from {}'.format(response.status_code, response.url))
+    return response.json()
+
+
+def fetch_feature_geometry(dataproduct_id: str, feature_id, feedback: QgsFeedback = None) -> QgsGeometry:
+    """
+    Fetches the geometry of a feature (blocking)
+    :return: the geometry in EPSG:2056
+    :raises RequestsException: if the request failed
+    :raises UnsupportedGeometryType: if the geometry type is not handled
+    """
+    url = feature_request_url(settings_snapshot(), dataproduct_id, feature_id)
+    (response, content) = NAM_POOL.fetch(url, headers=HEADERS, feedback=feedback)
+    if response.status_code != 200 or not response.ok:
+        raise RequestsException('status code {} from {}'.format(response.status_code, response.url))
+    # decoded again since the coordinates are modified while building the geometry
+    return geometry_from_feature_data(loads(content))
+
+
+class CatalogHarvester(QObject):
+    """
+    Makes the unfiltered searches completing the data product catalog (one result is enough), without blocking,
+    in the thread it was created in (the main thread). The searches of the user are filtered with the catalog,
+    so they cannot complete it. A harvest can be requested from any thread.
+    """
+    harvest_requested = pyqtSignal(str)
+
+    def __init__(self):
+        super().__init__()
+        self.handle = None
+        # queued when emitted from another thread
+        self.harvest_requested.connect(self.harvest)
+
+    @pyqtSlot(str)
+    def harvest(self, search_text: str):
+        url = search_request_url(settings_snapshot(), search_text, limit=1, filtered=False)
+        self.handle = NAM_POOL.request(url, headers=HEADERS, callback=self.harvest_finished)
+
+    def harvest_finished(self, response):
+        self.handle = None
+        if response.status_code != 200 or not response.ok:
+            dbg_info('data product catalog not harvested: status code {} from {}'.format(response.status_code, response.url))
+            return
+        try:
+            result_counts = response.json()['result_counts']
+        except (ValueError, KeyError) as e:
+            dbg_info('data product catalog not harvested: {}'.format(e))
+            return
+        if data_product_catalog().harvest(result_counts):
+            # the filter of the next searches
+            reload_settings_snapshot()
+
+
+_harvester = None
+
+
+def init_catalog_harvester():
+    """
+    Creates the harvester of the data product catalog, must be called in the main thread
+    """
+    global _harvester
+    if _harvester is None:
+        _harvester = CatalogHarvester()
+
+
+def request_catalog_harvest(search_text: str):
+    """
+    Requests a search to complete the data product catalog, at most once per HARVEST_INTERVAL.
+    Nothing is harvested if the harvester was not created (e.g. running without interface).
+    """
+    if _harvester is not None and data_product_catalog().claim_harvest():
+        _harvester.harvest_requested.emit(search_text)
@@ -28,19 +28,41 @@ class Settings(SettingManager):
         SettingManager.__init__(self, pluginName)
 
         self.add_setting(Integer('results_limit', Scope.Global, 20))
+        self.add_setting(Integer('recent_results_limit', Scope.Global, 5))
         self.add_setting(Bool('keep_scale', Scope.Global, False))
         self.add_setting(Double('point_scale', Scope.Global, 1000))
+
+        # local store of the fetched feature geometries
+        self.add_setting(Integer('feature_store_max_age', Scope.Global, 30))  # days
+        self.add_setting(Integer('feature_store_max_entries', Scope.Global, 10000))
         self.add_setting(Enum('default_layer_loading_mode', Scope.Global, LoadingMode.PG, enum_type=EnumType.Python))
 
         self.add_setting(Bool('wms_load_separate', Scope.Global, True))
-        self.add_setting(String('wms_image_format', Scope.Global, 'png', allowed_values=('png', 'jpeg')))
+        # auto: format and DPI mode are chosen from the measured throughput (kB/s)
+        self.add_setting(String('wms_image_format', Scope.Global, 'png', allowed_values=('png', 'jpeg', 'auto')))
+        self.add_setting(Integer('adaptive_slow_throughput', Scope.Global, 250))
+        self.add_setting(Integer('adaptive_fast_throughput', Scope.Global, 2000))
+
+        # background maps can be loaded as tiles (WMTS) which are kept in the QGIS network cache
+        self.add_setting(Bool('background_tiled', Scope.Global, False))
+        self.add_setting(String('wmts_tile_matrix_set', Scope.Global, '2056'))
+        self.add_setting(Integer('tile_cache_size', Scope.Global, 500))  # MB
 
         self.add_setting(String('pg_auth_id', Scope.Global, None))
+        # in automatic loading mode, tables with more visible features (estimated) are loaded as WMS
+        self.add_setting(Integer('auto_max_features', Scope.Global, 50000))
 
         # these settings should be empty, but can be overwritten for testing purpose
         self.add_setting(String('pg_service', Scope.Global, ''))
         self.add_setting(String('pg_host', Scope.Global, ''))
         self.add_setting(String('service_url', Scope.Global, ''))
+        self.add_setting(String('wmts_url', Scope.Global, ''))
+        # session metrics export: interval in seconds (0 to disable) and directory (empty for the profile folder)
+        self.add_setting(Integer('metrics_interval', Scope.Global, 60))
+        self.add_setting(String('metrics_directory', Scope.Global, ''))
+        # the next operations (searches, triggered results, layer loading) are profiled, decremented on each one
+        self.add_setting(Integer('profile_next_operations', Scope.Global, 0))
+        self.add_setting(String('profile_directory', Scope.Global, ''))
 
         # save only skipped categories so newly added categories will be enabled by default
         self.add_setting(Stringlist('skipped_dataproducts', Scope.Global, None))
@@ -48,15 +70,38 @@ class Settings(SettingManager):
 
 DEFAULT_PG_HOST = 'geodb.rootso.org'
 DEFAULT_PG_SERVICE = 'pub'
-
-PG_SERVICE = Settings().value('pg_service') or DEFAULT_PG_SERVICE
-PG_HOST = Settings().value('pg_host') or DEFAULT_PG_HOST
 PG_DB = 'pub'
 PG_PORT = '5432'
 
 DEFAULT_BASE_URL = 'https://geo.so.ch/api'
-BASE_URL = Settings().value('service_url') or DEFAULT_BASE_URL
-SEARCH_URL = '{}/search/v2'.format(BASE_URL)  # see https://geo-t.so.ch/api/search/v2/api/
-FEATURE_URL = '{}/data/v1'.format(BASE_URL)  # see https://geo-t.so.ch/api/data/v1/api/
-DATA_PRODUCT_URL = '{}/dataproduct/v1'.format(BASE_URL)  # see https://geo-t.so.ch/api/dataproduct/v1/api/
 
+
+# the following are read when needed (and not at import time) so that changes in the settings are effective immediately
+
+def pg_service(settings: Settings = None) -> str:
+    return (settings or Settings()).value('pg_service') or DEFAULT_PG_SERVICE
+
+
+def pg_host(settings: Settings = None) -> str:
+    return (settings or Settings()).value('pg_host') or DEFAULT_PG_HOST
+
+
+def base_url(settings: Settings = None) -> str:
+    return (settings or Settings()).value('service_url') or DEFAULT_BASE_URL
+
+
+def search_url(settings: Settings = None) -> str:
+    return '{}/search/v2'.format(base_url(settings))  # see https://geo-t.so.ch/api/search/v2/api/
+
+
+def feature_url(settings: Settings = None) -> str:
+    return '{}/data/v1'.format(base_url(settings))  # see https://geo-t.so.ch/api/data/v1/api/
+
+
+def data_product_url(settings: Settings = None) -> str:
+    return '{}/dataproduct/v1'.format(base_url(settings))  # see https://geo-t.so.ch/api/dataproduct/v1/api/
+
+
+def wmts_url(settings: Settings = None) -> str:
+    settings = settings or Settings()
+    return settings.value('wmts_url') or '{}/wmts/1.0.0/WMTSCapabilities.xml'.format(base_url(settings))
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+
+ QGIS Solothurn Locator Plugin
+ Copyright (C) 2019 Denis Rouzaud
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import threading
+from typing import NamedTuple
+
+from qgis.PyQt.QtCore import QObject, pyqtSignal, pyqtSlot
+
+from solocator.core.data_product_catalog import data_product_catalog
+from solocator.core.loading_mode import LoadingMode
+from solocator.core.settings import Settings, search_url, feature_url, data_product_url
+
+
+class SettingsSnapshot(NamedTuple):
+    """
+    An immutable copy of the settings used while searching and displaying results,
+    so that no settings are read in the search hot path.
+    """
+    results_limit: int
+    recent_results_limit: int
+    keep_scale: bool
+    point_scale: float
+    default_layer_loading_mode: LoadingMode
+    # the data products to search in, as given to the search service
+    dataproducts_filter: str
+    foreground_group: str
+    search_url: str
+    feature_url: str
+    data_product_url: str
+
+
+def build_settings_snapshot() -> SettingsSnapshot:
+    settings = Settings()
+    skipped = set(settings.value('skipped_dataproducts') or [])
+    loading_mode: LoadingMode = settings.value('default_layer_loading_mode')
+    return SettingsSnapshot(
+        results_limit=settings.value('results_limit'),
+        recent_results_limit=settings.value('recent_results_limit'),
+        keep_scale=settings.value('keep_scale'),
+        point_scale=settings.value('point_scale'),
+        default_layer_loading_mode=loading_mode,
+        dataproducts_filter=','.join(_id for _id in data_product_catalog().ids() if _id not in skipped),
+        foreground_group='Vordergrundkarten (Doppelklick: {normal}, Ctrl-Doppelklick: {alt})'.format(
+            normal=loading_mode, alt=loading_mode.alternate_mode()
+        ),
+        search_url=search_url(settings),
+        feature_url=feature_url(settings),
+        data_product_url=data_product_url(settings)
+    )
+
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def settings_snapshot() -> SettingsSnapshot:
+    """
+    Returns the current snapshot.
+    It is built in the main thread by init_settings_snapshot, or on first use when running without interface.
+    """
+    snapshot = _snapshot
+    if snapshot is None:
+        snapshot = reload_settings_snapshot()
+    return snapshot
+
+
+def reload_settings_snapshot() -> SettingsSnapshot:
+    """
+    Builds a new snapshot from the settings and replaces the current one.
+    Must be called when the settings (or the data product catalog) have changed.
+    """
+    global _snapshot
+    snapshot = build_settings_snapshot()
+    with _snapshot_lock:
+        _snapshot = snapshot
+    return snapshot
+
+
+class SnapshotReloader(QObject):
+    """
+    Reloads the snapshot in the thread it was created in (the main thread), the reload can be requested from any thread
+    """
+    reload_requested = pyqtSignal()
+
+    def __init__(self):
+        super().__init__()
+        # queued when emitted from another thread
+        self.reload_requested.connect(self.reload)
+
+    @pyqtSlot()
+    def reload(self):
+        reload_settings_snapshot()
+
+
+_reloader = None
+
+
+def init_settings_snapshot():
+    """
+    Builds the snapshot, must be called in the main thread so that the settings are not read on the search path
+    """
+    global _reloader
+    if _reloader is None:
+        _reloader = SnapshotReloader()
+    reload_settings_snapshot()
+
+
+def request_settings_snapshot_reload():
+    """
+    Requests the snapshot to be reloaded in the main thread, e.g. from a search when the data product catalog changed
+    """
+    if _reloader is not None:
+        _reloader.reload_requested.emit()
+    else:
+        reload_settings_snapshot()
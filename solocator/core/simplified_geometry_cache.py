@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+
+ QGIS Solothurn Locator Plugin
+ Copyright (C) 2019 Denis Rouzaud
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import math
+from collections import OrderedDict
+
+from qgis.core import QgsGeometry
+
+from solocator.core.metrics import METRICS
+
+# geometries with less vertices are always drawn at full detail
+MIN_VERTICES = 1000
+CACHE_SIZE = 32
+
+
+class SimplifiedGeometryCache:
+    """
+    Simplifies geometries to the resolution they are displayed at (level of detail).
+    Simplified geometries are cached per feature and zoom bucket,
+    a zoom bucket covers resolutions between two powers of 2 (in map units per pixel).
+    """
+
+    def __init__(self, size: int = CACHE_SIZE):
+        self.size = size
+        self.cache = OrderedDict()
+
+    def clear(self):
+        self.cache.clear()
+
+    def simplified(self, geometry: QgsGeometry, map_units_per_pixel: float, key: str = None) -> QgsGeometry:
+        """
+        Returns the geometry simplified for the given resolution
+        :param geometry: the geometry (in map units)
+        :param map_units_per_pixel: the resolution of the map canvas
+        :param key: a unique key of the feature, if None the result is not cached
+        """
+        if map_units_per_pixel <= 0 or geometry.isEmpty() or geometry.constGet().nCoordinates() < MIN_VERTICES:
+            return geometry
+
+        # the lower bound of the bucket is used as tolerance so the error is always below one pixel
+        bucket = math.floor(math.log2(map_units_per_pixel))
+        if key is not None:
+            hit = (key, bucket) in self.cache
+            METRICS.record_cache('simplified_geometry', hit)
+            if hit:
+                self.cache.move_to_end((key, bucket))
+                return self.cache[(key, bucket)]
+
+        simplified = geometry.simplify(2 ** bucket)
+        if simplified.isNull() or simplified.isEmpty():
+            simplified = geometry
+
+        if key is not None:
+            self.cache[(key, bucket)] = simplified
+            if len(self.cache) > self.size:
+                self.cache.popitem(last=False)
+        return simplified
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+
+ QGIS Solothurn Locator Plugin
+ Copyright (C) 2019 Denis Rouzaud
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import re
+import time
+
+from osgeo import ogr
+from qgis.core import Qgis, QgsTask, QgsVectorLayer, QgsVectorFileWriter, QgsCoordinateTransformContext, \
+    QgsRectangle, QgsDataProvider, QgsDataSourceUri, QgsProviderRegistry
+
+from solocator.core.utils import local_file_path, info
+
+FILE_NAME = 'snapshots.gpkg'
+
+# custom properties of the layers loaded from PostgreSQL by SoLocator
+PG_SOURCE_PROPERTY = 'solocator/pg_source'
+# the extent (WKT in the layer CRS) of the snapshot, set while the layer is read from the snapshot
+SNAPSHOT_EXTENT_PROPERTY = 'solocator/snapshot_extent'
+
+
+def is_solocator_pg_layer(layer) -> bool:
+    return isinstance(layer, QgsVectorLayer) and bool(layer.customProperty(PG_SOURCE_PROPERTY))
+
+
+def is_snapshot(layer) -> bool:
+    return is_solocator_pg_layer(layer) and layer.providerType() == 'ogr'
+
+
+def snapshot_table_name(pg_source: str) -> str:
+    """
+    Returns a new table name for a snapshot, a refreshed snapshot is written to a new table
+    so that the table read by the layer is not overwritten
+    """
+    uri = QgsDataSourceUri(pg_source)
+    return re.sub(r'\W', '_', '{}_{}_{}'.format(uri.schema(), uri.table(), int(time.time() * 1000)))
+
+
+def snapshot_layer_table(layer: QgsVectorLayer) -> str:
+    """
+    Returns the table of the GeoPackage read by a snapshot layer
+    """
+    return QgsProviderRegistry.instance().decodeUri('ogr', layer.source()).get('layerName')
+
+
+class SnapshotTask(QgsTask):
+    """
+    Copies the features of PG layers within an extent to the local GeoPackage (in a background thread).
+    The layers are exported one after the other since they are written to the same file,
+    and the tasks must not run concurrently (see SnapshotActions).
+    """
+
+    def __init__(self, layers: list, transform_context: QgsCoordinateTransformContext, callback,
+                 obsolete_tables: list = ()):
+        """
+        :param layers: list of (layer ID, PG source, name, extent in the layer CRS)
+        :param callback: called on the main thread with the task once finished, exported holds the exported layers as
+                         (layer ID, GeoPackage source, extent)
+        :param obsolete_tables: tables of the GeoPackage not read anymore, they are dropped first
+        """
+        super().__init__('SoLocator: Lokale Kopie', QgsTask.Flag.CanCancel)
+        self.layers = layers
+        self.transform_context = QgsCoordinateTransformContext(transform_context)
+        self.callback = callback
+        self.obsolete_tables = list(obsolete_tables)
+        self.path = local_file_path(FILE_NAME)
+        self.exported = []
+        self.errors = []
+
+    def drop_obsolete_tables(self):
+        if not self.obsolete_tables:
+            return
+        data_source = ogr.Open(self.path, 1)
+        if data_source is None:
+            return
+        for table in self.obsolete_tables:
+            if data_source.GetLayerByName(table) is not None:
+                data_source.DeleteLayer(table)
+        data_source = None
+
+    def run(self) -> bool:
+        self.drop_obsolete_tables()
+        for i, (layer_id, pg_source, name, extent) in enumerate(self.layers):
+            if self.isCanceled():
+                return False
+            # a layer is created in this thread, the one of the project must not be used here
+            layer = QgsVectorLayer(pg_source, name, 'postgres')
+            if not layer.isValid():
+                self.errors.append('{}: PostgreSQL layer is not valid'.format(name))
+                continue
+            table = snapshot_table_name(pg_source)
+            options = QgsVectorFileWriter.SaveVectorOptions()
+            options.driverName = 'GPKG'
+            options.layerName = table
+            options.fileEncoding = 'UTF-8'
+            options.filterExtent = QgsRectangle(extent)
+            options.actionOnExistingFile = QgsVectorFileWriter.ActionOnExistingFile.CreateOrOverwriteLayer
+            result = QgsVectorFileWriter.writeAsVectorFormatV3(layer, self.path, self.transform_context, options)
+            if result[0] != QgsVectorFileWriter.WriterError.NoError:
+                self.errors.append('{}: {}'.format(name, result[1]))
+                continue
+            self.exported.append((layer_id, '{}|layername={}'.format(self.path, table), extent))
+            self.setProgress(100 * (i + 1) / len(self.layers))
+        return True
+
+    def finished(self, result: bool):
+        for error in self.errors:
+            info('SoLocator: Lokale Kopie fehlgeschlagen: {}'.format(error), Qgis.MessageLevel.Warning)
+        self.callback(self)
+
+
+def use_snapshot(layer: QgsVectorLayer, source: str, extent: QgsRectangle):
+    """
+    Swaps the source of the layer to its snapshot, the style is kept and also stored in the GeoPackage
+    """
+    layer.setDataSource(source, layer.name(), 'ogr', QgsDataProvider.ProviderOptions())
+    layer.setCustomProperty(SNAPSHOT_EXTENT_PROPERTY, extent.asWktPolygon())
+    layer.saveStyleToDatabase(layer.name(), 'SoLocator', True, '')
+    layer.triggerRepaint()
+
+
+def revert_snapshot(layer: QgsVectorLayer):
+    """
+    Swaps the source of the layer back to PostgreSQL
+    """
+    layer.setDataSource(layer.customProperty(PG_SOURCE_PROPERTY), layer.name(), 'postgres',
+                        QgsDataProvider.ProviderOptions())
+    layer.removeCustomProperty(SNAPSHOT_EXTENT_PROPERTY)
+    layer.triggerRepaint()
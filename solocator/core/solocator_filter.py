@@ -18,68 +18,143 @@
 """
 
 
-import json
 import os
 import sys
 import traceback
 
-from qgis.PyQt.QtCore import Qt, QTimer, QUrl, QUrlQuery, pyqtSignal
+from qgis.PyQt.QtCore import Qt, QTimer, pyqtSignal
 from qgis.PyQt.QtGui import QColor
 from qgis.PyQt.QtWidgets import QWidget, QApplication
 
-from qgis.core import Qgis, QgsLocatorFilter, QgsLocatorResult, QgsCoordinateReferenceSystem, \
+from qgis.core import Qgis, QgsApplication, QgsLocatorFilter, QgsLocatorResult, QgsCoordinateReferenceSystem, \
     QgsCoordinateTransform, QgsProject, QgsGeometry, QgsWkbTypes, QgsPointXY, QgsLocatorContext, QgsFeedback
 from qgis.gui import QgsRubberBand, QgisInterface, QgsMapCanvas, QgsFilterLineEdit
 
-from solocator.core.network_access_manager import NetworkAccessManager, RequestsException, RequestsExceptionUserAbort
-from solocator.core.settings import Settings, SEARCH_URL, FEATURE_URL, DATA_PRODUCT_URL
-from solocator.core.layer_loader import LayerLoader
-from solocator.core.data_products import DATA_PRODUCTS, dataproduct2icon_description
-from solocator.core.loading_mode import LoadingMode
+from solocator.core.network_access_manager import NAM_POOL, RequestsException, RequestsExceptionUserAbort
+from solocator.core.settings_snapshot import settings_snapshot, reload_settings_snapshot, init_settings_snapshot
+from solocator.core.data_products import dataproduct2icon_description
+from solocator.core.layer_catalog import layer_catalog
+from solocator.core.metrics import METRICS, metrics_writer
+from solocator.core.profiling import profiled, profiler
+from solocator.core.coordinates import parse_coordinate, format_coordinate, LV95
+from solocator.core.recent_results import recent_results, FEATURE, DATA_PRODUCT
+from solocator.core.simplified_geometry_cache import SimplifiedGeometryCache
+from solocator.core.feature_store import feature_store
+from solocator.core.table_statistics import clear_table_statistics
+from solocator.core.feature_task import FeatureGeometryTask, UnsupportedGeometryType
+from solocator.core.feature_batch import FeatureBatch
+from solocator.core.search_client import HEADERS, search_request_url, feature_request_url, init_catalog_harvester, \
+    request_catalog_harvest
 from solocator.core.utils import DEBUG
-from solocator.gui.config_dialog import ConfigDialog
+
+
+def intern(value):
+    """
+    Interns the strings repeated across many results (IDs, types)
+    """
+    return sys.intern(value) if type(value) == str else value
 
 
 class FeatureResult:
+    # results are compact records, since there can be several hundreds of them
+    __slots__ = ('dataproduct_id', 'id_field_name', 'id_field_type', 'feature_id')
+
     def __init__(self, dataproduct_id, id_field_name, id_field_type, feature_id):
-        self.dataproduct_id = dataproduct_id
-        self.id_field_name = id_field_name
-        self.id_field_type = id_field_type
+        self.dataproduct_id = intern(dataproduct_id)
+        self.id_field_name = intern(id_field_name)
+        self.id_field_type = intern(id_field_type)
         self.feature_id = feature_id
 
     def __repr__(self):
         return 'SoLocator Feature: {}/{}'.format(self.dataproduct_id, self.feature_id)
 
+    def key(self):
+        return '{}:{}:{}'.format(FEATURE, self.dataproduct_id, self.feature_id)
+
+    def as_dict(self) -> dict:
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
 
 class DataProductResult:
+    __slots__ = ('type', 'dataproduct_id', 'display', 'dset_info', 'stacktype', 'sublayers')
+
     def __init__(self, type, dataproduct_id, display, dset_info, stacktype, sublayers):
-        self.type = type
-        self.dataproduct_id = dataproduct_id
+        """
+        :param sublayers: the sublayers (as returned by the search service) or their data product IDs
+        """
+        self.type = intern(type)
+        self.dataproduct_id = intern(dataproduct_id)
         self.display = display
         self.dset_info = dset_info
-        self.stacktype = stacktype
-        self.sublayers = sublayers
+        self.stacktype = intern(stacktype)
+        # only the references to the sublayers are kept
+        self.sublayers = tuple(
+            intern(layer['dataproduct_id'] if isinstance(layer, dict) else layer) for layer in sublayers
+        ) if sublayers else None
 
     def __repr__(self):
         return 'SoLocator Data Product: {} {} ()'.format(self.type, self.dataproduct_id, self.dset_info, self.sublayers)
 
+    def key(self):
+        return '{}:{}'.format(DATA_PRODUCT, self.dataproduct_id)
+
+    def as_dict(self) -> dict:
+        data = {slot: getattr(self, slot) for slot in self.__slots__}
+        data['sublayers'] = list(self.sublayers) if self.sublayers else None
+        return data
+
+
+class RecentResult:
+    """
+    A result from the local store of recent results, wrapping the original result
+    """
+    def __init__(self, key: str, result):
+        self.key = key
+        self.result = result
+
+
+class CoordinateResult:
+    def __init__(self, point: QgsPointXY, crs: str):
+        self.point = point
+        self.crs = crs
+
+    def __repr__(self):
+        return 'SoLocator Coordinate: {} {}'.format(self.point.asWkt(), self.crs)
+
 
 class FilterResult:
     """
     A result holder for sub-filtering
     """
+    __slots__ = ('filter_word', 'search')
+
     def __init__(self, filter_word, search):
         self.filter_word = filter_word
         self.search = search
 
 
+class ShowAllResult:
+    """
+    A result to show all the features of a search on the map
+    """
+    def __init__(self, features: list, search: str):
+        """
+        :param features: list of (FeatureResult, display string)
+        """
+        self.features = features
+        self.search = search
+
+
 class NoResult:
     pass
 
 
+MUNICIPALITY_DATAPRODUCT = 'ch.so.agi.gemeindegrenzen'
+
+
 class SoLocatorFilter(QgsLocatorFilter):
 
-    HEADERS = {b'User-Agent': b'Mozilla/5.0 QGIS SoLocator Filter'}
+    HEADERS = HEADERS
 
     message_emitted = pyqtSignal(str, str, Qgis.MessageLevel, QWidget)
 
@@ -90,32 +165,34 @@ class SoLocatorFilter(QgsLocatorFilter):
         super().__init__()
 
         self.iface = iface
-        self.settings = Settings()
 
         #  following properties will only be used in main thread
         self.rubber_band = None
         self.map_canvas: QgsMapCanvas = None
-        self.transform_ch = None
+        self.transforms = {}
+        self.simplified_geometries = SimplifiedGeometryCache()
         self.current_timer = None
         self.result_found = False
-        self.nam_fetch_feature = None
+        self.snapshot = None
+        # the request handle of the current trigger, previous ones are aborted
+        self.nam_trigger = None
+        # incremented on every trigger, responses of previous generations are dropped
+        self.trigger_generation = 0
+        # running feature geometry tasks (a reference must be kept while they run), with their revalidate flag
+        self.feature_tasks = {}
+        # the batch showing all the features of a search
+        self.feature_batch = None
+        # the geometry (EPSG:2056) of the last highlighted municipality, used for snapshots
+        self.last_municipality = None
 
         if iface is not None:
             # happens only in main thread
+            # rubber band and transforms are only created when first needed to keep the plugin startup fast
             self.map_canvas = iface.mapCanvas()
-            self.map_canvas.destinationCrsChanged.connect(self.create_transforms)
-
-            self.rubber_band = QgsRubberBand(self.map_canvas, QgsWkbTypes.GeometryType.PolygonGeometry)
-            self.rubber_band.setColor(QColor(255, 50, 50, 200))
-            self.rubber_band.setFillColor(QColor(255, 255, 50, 160))
-            self.rubber_band.setBrushStyle(Qt.BrushStyle.SolidPattern)
-            self.rubber_band.setLineStyle(Qt.PenStyle.SolidLine)
-            self.rubber_band.setIcon(self.rubber_band.ICON_CIRCLE)
-            self.rubber_band.setIconSize(15)
-            self.rubber_band.setWidth(4)
-            self.rubber_band.setBrushStyle(Qt.BrushStyle.NoBrush)
-
-            self.create_transforms()
+            self.map_canvas.destinationCrsChanged.connect(self.clear_transforms)
+            # the settings are read here, not in the search threads
+            init_settings_snapshot()
+            init_catalog_harvester()
 
     def name(self):
         return 'SoLocator'
@@ -145,30 +222,49 @@ class SoLocatorFilter(QgsLocatorFilter):
         return True
 
     def openConfigWidget(self, parent=None):
+        # imported here since loading the UI file is expensive and not needed at startup
+        from solocator.gui.config_dialog import ConfigDialog
         dlg = ConfigDialog(parent)
-        dlg.exec()
-
-    def create_transforms(self):
+        if dlg.exec():
+            reload_settings_snapshot()
+            # None if the plugin interface was not initialized
+            if profiler() is not None:
+                profiler().reload()
+            if metrics_writer() is not None:
+                metrics_writer().reload()
+            # the PG connection settings may have changed
+            clear_table_statistics()
+
+    def create_rubber_band(self):
         # this should happen in the main thread
-        src_crs_ch = QgsCoordinateReferenceSystem('EPSG:2056')
-        assert src_crs_ch.isValid()
-        dst_crs = self.map_canvas.mapSettings().destinationCrs()
-        self.transform_ch = QgsCoordinateTransform(src_crs_ch, dst_crs, QgsProject.instance())
-
-    def enabled_dataproducts(self):
-        categories = DATA_PRODUCTS.keys()
-        skipped = self.settings.value('skipped_dataproducts')
-        return ','.join(list(filter(lambda id: id not in skipped, categories)))
-
-    @staticmethod
-    def url_with_param(url, params) -> str:
-        url = QUrl(url)
-        q = QUrlQuery(url)
-        for key, value in params.items():
-            q.addQueryItem(key, value)
-        url.setQuery(q)
-        return url.url()
-
+        self.rubber_band = QgsRubberBand(self.map_canvas, QgsWkbTypes.GeometryType.PolygonGeometry)
+        self.rubber_band.setColor(QColor(255, 50, 50, 200))
+        self.rubber_band.setFillColor(QColor(255, 255, 50, 160))
+        self.rubber_band.setBrushStyle(Qt.BrushStyle.SolidPattern)
+        self.rubber_band.setLineStyle(Qt.PenStyle.SolidLine)
+        self.rubber_band.setIcon(self.rubber_band.ICON_CIRCLE)
+        self.rubber_band.setIconSize(15)
+        self.rubber_band.setWidth(4)
+        self.rubber_band.setBrushStyle(Qt.BrushStyle.NoBrush)
+
+    def coordinate_transform(self, src_crs: str = LV95) -> QgsCoordinateTransform:
+        """
+        Returns the transform from the given CRS to the canvas CRS, transforms are cached until the canvas CRS changes
+        """
+        # this should happen in the main thread
+        if src_crs not in self.transforms:
+            src = QgsCoordinateReferenceSystem(src_crs)
+            assert src.isValid()
+            dst_crs = self.map_canvas.mapSettings().destinationCrs()
+            self.transforms[src_crs] = QgsCoordinateTransform(src, dst_crs, QgsProject.instance())
+        return self.transforms[src_crs]
+
+    def clear_transforms(self):
+        # transforms will be re-created on next use
+        self.transforms = {}
+        self.simplified_geometries.clear()
+
+    @profiled('search')
     def fetchResults(self, search: str, context: QgsLocatorContext, feedback: QgsFeedback):
         try:
             self.dbg_info("start solocator search...")
@@ -176,21 +272,25 @@ class SoLocatorFilter(QgsLocatorFilter):
             if len(search) < 3:
                 return
 
+            # coordinates are handled locally, the search service cannot answer them
+            coordinate = parse_coordinate(search)
+            if coordinate is not None:
+                self.emit_coordinate_result(*coordinate)
+                return
+
             self.result_found = False
+            # settings are read once for the whole search
+            self.snapshot = settings_snapshot()
 
-            params = {
-                'searchtext': str(search),
-                'filter': self.enabled_dataproducts(),
-                'limit': str(self.settings.value('results_limit'))
-            }
+            # recent results and known map layers are served locally before the network request
+            local_keys = self.emit_recent_results(search)
+            local_keys |= self.emit_local_layer_results(search, local_keys)
 
-            nam = NetworkAccessManager()
-            feedback.canceled.connect(nam.abort)
-            url = self.url_with_param(SEARCH_URL, params)
+            url = search_request_url(self.snapshot, search)
             self.dbg_info(url)
             try:
-                (response, content) = nam.request(url, headers=self.HEADERS, blocking=True)
-                self.handle_response(response, search)
+                (response, content) = NAM_POOL.fetch(url, headers=self.HEADERS, feedback=feedback)
+                self.handle_response(response, search, local_keys)
             except RequestsExceptionUserAbort:
                 pass
             except RequestsException as err:
@@ -203,6 +303,10 @@ class SoLocatorFilter(QgsLocatorFilter):
                 result.userData = NoResult
                 self.resultFetched.emit(result)
 
+            if not feedback.isCanceled():
+                # made in the main thread, the search does not wait for it
+                request_catalog_harvest(search)
+
         except Exception as e:
             self.info(e, Qgis.MessageLevel.Critical)
             exc_type, exc_obj, exc_traceback = sys.exc_info()
@@ -210,6 +314,65 @@ class SoLocatorFilter(QgsLocatorFilter):
             self.info('{} {} {}'.format(exc_type, filename, exc_traceback.tb_lineno), Qgis.MessageLevel.Critical)
             self.info(traceback.print_exception(exc_type, exc_obj, exc_traceback), Qgis.MessageLevel.Critical)
 
+    def emit_recent_results(self, search: str) -> set:
+        """
+        Emits the recently used results matching the search
+        :return: the keys of the emitted results
+        """
+        keys = set()
+        score = 1
+        for entry in recent_results().search(search, self.snapshot.recent_results_limit):
+            result = QgsLocatorResult()
+            result.filter = self
+            result.displayString = entry['display']
+            result.group = 'Zuletzt verwendet'
+            result.groupScore = 0.95
+            if entry['kind'] == FEATURE:
+                user_data = FeatureResult(**entry['data'])
+                result.icon, result.description = dataproduct2icon_description(user_data.dataproduct_id, None)
+            else:
+                user_data = DataProductResult(**entry['data'])
+                result.icon, result.description = dataproduct2icon_description('dataproduct', user_data.type)
+            result.userData = RecentResult(entry['key'], user_data)
+            result.score = score
+            self.resultFetched.emit(result)
+            score -= 0.001
+            keys.add(entry['key'])
+            self.result_found = True
+        return keys
+
+    def emit_local_layer_results(self, search: str, skipped_keys: set) -> set:
+        """
+        Emits the map layers of the local catalog matching the search
+        :param skipped_keys: keys of the results already emitted
+        :return: the keys of the emitted results
+        """
+        keys = set()
+        score = 1
+        # the map layers (foreground) and background maps can be skipped in the settings
+        searched = set(self.snapshot.dataproducts_filter.split(','))
+        for entry in layer_catalog().search(search, self.snapshot.results_limit):
+            if entry['stacktype'] not in searched:
+                continue
+            result = self.data_product_qgsresult(entry, entry['parent'] is not None, score, entry['stacktype'])
+            if result.userData.key() in skipped_keys:
+                continue
+            self.resultFetched.emit(result)
+            score -= 0.001
+            keys.add(result.userData.key())
+            self.result_found = True
+        return keys
+
+    def emit_coordinate_result(self, point: QgsPointXY, crs: str):
+        result = QgsLocatorResult()
+        result.filter = self
+        result.displayString = format_coordinate(point, crs)
+        result.group = 'Koordinaten'
+        result.groupScore = 1
+        result.userData = CoordinateResult(point, crs)
+        result.score = 1
+        self.resultFetched.emit(result)
+
     def data_product_qgsresult(self, data: dict, sub_layer: bool, score: float, stacktype) -> QgsLocatorResult:
         result = QgsLocatorResult()
         result.filter = self
@@ -218,8 +381,7 @@ class SoLocatorFilter(QgsLocatorFilter):
             result.group = 'Hintergrundkarten'
             result.groupScore = 0.7
         else:
-            loading_mode: LoadingMode = self.settings.value('default_layer_loading_mode')
-            result.group = 'Vordergrundkarten (Doppelklick: {normal}, Ctrl-Doppelklick: {alt})'.format(normal=loading_mode, alt=loading_mode.alternate_mode())
+            result.group = self.snapshot.foreground_group
             result.groupScore = 0.8
         result.userData = DataProductResult(
             type=data['type'],
@@ -235,20 +397,30 @@ class SoLocatorFilter(QgsLocatorFilter):
         result.score = score
         return result
 
-    def handle_response(self, response, search_text: str):
+    def handle_response(self, response, search_text: str, skipped_keys: set = frozenset()):
+        """
+        Emits the results of the search response
+        :param skipped_keys: keys of the results already emitted locally (recent results and layer catalog)
+        """
         try:
-            if response.status_code != 200:
+            if response.status_code != 200 or not response.ok:
                 if not isinstance(response.exception, RequestsExceptionUserAbort):
                     self.info("Error in main response with status code: "
                               "{} from {}".format(response.status_code, response.url))
                 return
 
-            data = json.loads(response.content.decode('utf-8'))
+            # the decoded content is shared with the identical searches
+            data = response.json()
 
             # Since results are ordered by score (0 to 1)
             # we use an ordering score to keep the same order than the one from the remote service
             score = 1
 
+            layer_catalog().harvest(data['results'])
+
+            # all the features, to show them together on the map
+            features = []
+
             # sub-filtering
             # dbg_info(data['result_counts'])
             if len(data['result_counts']) > 1:
@@ -285,6 +457,10 @@ class SoLocatorFilter(QgsLocatorFilter):
                         id_field_type=f['id_field_type'],
                         feature_id=f['feature_id']
                     )
+                    features.append((result.userData, result.displayString))
+                    if result.userData.key() in skipped_keys:
+                        self.result_found = True
+                        continue
                     data_product = f['dataproduct_id']
                     data_type = None
                     result.icon, result.description = dataproduct2icon_description(data_product, data_type)
@@ -296,14 +472,17 @@ class SoLocatorFilter(QgsLocatorFilter):
                     dp = res['dataproduct']
                     # self.dbg_info("data_product: {}".format(dp))
                     result = self.data_product_qgsresult(dp, False, score, dp['stacktype'])
-                    self.resultFetched.emit(result)
-                    score -= 0.001
+                    if result.userData.key() not in skipped_keys:
+                        self.resultFetched.emit(result)
+                        score -= 0.001
 
                     # also give sublayers
                     for layer in dp.get('sublayers', []):
                         always_show_sublayers = True
                         if always_show_sublayers or search_text.lower() in layer['display'].lower():
                             result = self.data_product_qgsresult(layer, True, score, dp['stacktype'])
+                            if result.userData.key() in skipped_keys:
+                                continue
                             self.resultFetched.emit(result)
                             score -= 0.001
 
@@ -312,6 +491,17 @@ class SoLocatorFilter(QgsLocatorFilter):
 
                 self.result_found = True
 
+            if len(features) > 1:
+                result = QgsLocatorResult()
+                result.filter = self
+                # Show all {count} places on the map
+                result.displayString = 'Alle {} Orte auf der Karte anzeigen'.format(len(features))
+                result.group = 'Orte'
+                result.groupScore = 0.9
+                result.userData = ShowAllResult(features, search_text)
+                result.score = score
+                self.resultFetched.emit(result)
+
         except Exception as e:
             self.info(str(e), Qgis.MessageLevel.Critical)
             exc_type, exc_obj, exc_traceback = sys.exc_info()
@@ -319,25 +509,78 @@ class SoLocatorFilter(QgsLocatorFilter):
             self.info('{} {} {}'.format(exc_type, filename, exc_traceback.tb_lineno), Qgis.MessageLevel.Critical)
             self.info(traceback.print_exception(exc_type, exc_obj, exc_traceback), Qgis.MessageLevel.Critical)
 
+    @profiled('trigger')
     def triggerResult(self, result: QgsLocatorResult):
         # this is run in the main thread, i.e. map_canvas is not None
         self.clearPreviousResults()
+        self.new_trigger_generation()
 
         ctrl_clicked = Qt.KeyboardModifier.ControlModifier == QApplication.instance().queryKeyboardModifiers()
         self.dbg_info(("CTRL pressed: {}".format(ctrl_clicked)))
 
         user_data = self.get_user_data(result)
+        if type(user_data) in (FeatureResult, DataProductResult):
+            self.record_result(result, user_data)
+
         if type(user_data) == NoResult:
             pass
         elif type(user_data) == FilterResult:
             self.filtered_search(user_data)
+        elif type(user_data) == CoordinateResult:
+            self.show_coordinate(user_data)
         elif type(user_data) == FeatureResult:
             self.fetch_feature(user_data)
+        elif type(user_data) == ShowAllResult:
+            self.show_all_features(user_data)
         elif type(user_data) == DataProductResult:
             self.fetch_data_product(user_data, ctrl_clicked)
+        elif type(user_data) == RecentResult:
+            self.trigger_recent_result(user_data, ctrl_clicked)
         else:
             self.info('Incorrect result. Please contact support', Qgis.MessageLevel.Critical)
 
+    def new_trigger_generation(self):
+        """
+        Starts a new trigger generation and aborts the request of the previous one
+        """
+        self.trigger_generation += 1
+        if self.nam_trigger is not None:
+            self.nam_trigger.abort()
+            self.nam_trigger = None
+        # revalidations are left running to update the feature store
+        for task, revalidate in self.feature_tasks.items():
+            if not revalidate:
+                task.cancel()
+
+    def is_stale(self, generation: int) -> bool:
+        if generation != self.trigger_generation:
+            self.dbg_info('dropping response of superseded trigger #{}'.format(generation))
+            return True
+        return False
+
+    def record_result(self, result: QgsLocatorResult, user_data):
+        if type(user_data) == FeatureResult:
+            recent_results().record(user_data.key(), FEATURE, result.displayString, result.group, user_data.as_dict())
+        else:
+            recent_results().record(user_data.key(), DATA_PRODUCT, user_data.display, result.group, user_data.as_dict())
+
+    def trigger_recent_result(self, recent_result: RecentResult, alternate_mode: bool):
+        user_data = recent_result.result
+        entry = recent_results().get(recent_result.key)
+        if entry is not None:
+            recent_results().record(entry['key'], entry['kind'], entry['display'], entry['group'], entry['data'])
+        if type(user_data) == FeatureResult:
+            # the geometry might be in the feature store
+            self.fetch_feature(user_data)
+        else:
+            content = recent_results().dataproduct(recent_result.key) if entry else None
+            METRICS.record_cache('recent_dataproduct', content is not None)
+            if content is not None:
+                self.dbg_info('using cached data product for {}'.format(user_data))
+                self.load_data_product(content, user_data.stacktype == 'background', alternate_mode)
+            else:
+                self.fetch_data_product(user_data, alternate_mode)
+
     def filtered_search(self, filter_result: FilterResult):
         search_text = '{prefix} {filter_word}: {search}'.format(
             prefix=self.activePrefix(), filter_word=filter_result.filter_word, search=filter_result.search
@@ -354,21 +597,35 @@ class SoLocatorFilter(QgsLocatorFilter):
                     return
             raise NameError('Locator not found')
 
-    def highlight(self, geometry: QgsGeometry):
+    def highlight(self, geometry: QgsGeometry, key: str = None):
+        """
+        Highlights the geometry and zooms to it
+        :param geometry: the geometry in the canvas CRS
+        :param key: a unique key of the feature, used to cache its simplified geometry
+        """
         self.clearPreviousResults()
         if geometry is None:
             return
 
-        self.rubber_band.reset(geometry.type())
-        self.rubber_band.addGeometry(geometry, None)
-
         rect = geometry.boundingBox()
-        if not self.settings.value('keep_scale'):
+        settings = settings_snapshot()
+        if not settings.keep_scale:
             if rect.isEmpty():
                 current_extent = self.map_canvas.extent()
-                rect = current_extent.scaled(self.settings.value('point_scale')/self.map_canvas.scale(), rect.center())
+                rect = current_extent.scaled(settings.point_scale/self.map_canvas.scale(), rect.center())
             else:
                 rect.scale(4)
+
+        # draw the geometry simplified to the resolution of the target extent
+        if self.map_canvas.width() > 0 and self.map_canvas.height() > 0:
+            map_units_per_pixel = max(rect.width() / self.map_canvas.width(), rect.height() / self.map_canvas.height())
+            geometry = self.simplified_geometries.simplified(geometry, map_units_per_pixel, key)
+
+        if self.rubber_band is None:
+            self.create_rubber_band()
+        self.rubber_band.reset(geometry.type())
+        self.rubber_band.addGeometry(geometry, None)
+
         self.map_canvas.setExtent(rect)
         self.map_canvas.refresh()
 
@@ -377,82 +634,137 @@ class SoLocatorFilter(QgsLocatorFilter):
         self.current_timer.setSingleShot(True)
         self.current_timer.start(5000)
 
+    def show_coordinate(self, coordinate: CoordinateResult):
+        geometry = QgsGeometry.fromPointXY(coordinate.point)
+        geometry.transform(self.coordinate_transform(coordinate.crs))
+        self.highlight(geometry)
+
     def fetch_feature(self, feature: FeatureResult):
         self.dbg_info(feature)
-        url = '{url}/{dataset}/{id}'.format(
-            url=FEATURE_URL, dataset=feature.dataproduct_id, id=feature.feature_id
-        )
-        self.nam_fetch_feature = NetworkAccessManager()
+        url = feature_request_url(settings_snapshot(), feature.dataproduct_id, feature.feature_id)
+        generation = self.trigger_generation
+
+        # show the stored geometry right away, the request is then only used to revalidate the store
+        stored_geometry = feature_store().get(feature.dataproduct_id, feature.feature_id)
+        revalidate = stored_geometry is not None
+        if revalidate:
+            self.dbg_info('using stored geometry for {}'.format(feature))
+            self.remember_municipality(feature, stored_geometry)
+            stored_geometry.transform(self.coordinate_transform())
+            self.highlight(stored_geometry, feature.key())
+
         self.dbg_info(url)
-        self.nam_fetch_feature.finished.connect(self.parse_feature_response)
-        self.nam_fetch_feature.request(url, headers=self.HEADERS, blocking=False)
+        self.nam_trigger = NAM_POOL.request(
+            url, headers=self.HEADERS,
+            callback=lambda response: self.parse_feature_response(response, feature, generation, revalidate)
+        )
 
-    def parse_feature_response(self, response):
-        if response.status_code != 200:
-            if not isinstance(response.exception, RequestsExceptionUserAbort):
+    def parse_feature_response(self, response, feature: FeatureResult, generation: int, revalidate: bool = False):
+        """
+        :param revalidate: if True, the feature has already been highlighted from the store which only needs to be updated
+        """
+        if not revalidate and self.is_stale(generation):
+            return
+        if generation == self.trigger_generation:
+            # the request has completed, it must not be aborted anymore
+            self.nam_trigger = None
+
+        if response.status_code != 200 or not response.ok:
+            if not revalidate and not isinstance(response.exception, RequestsExceptionUserAbort):
                 self.info("Error in feature response with status code: "
                           "{} from {}".format(response.status_code, response.url))
             return
 
-        data = json.loads(response.content.decode('utf-8'))
-        self.dbg_info(data.keys())
-        self.dbg_info(data['properties'])
-        self.dbg_info(data['geometry'])
-        self.dbg_info(data['crs'])
-        self.dbg_info(data['type'])
-
-        assert data['crs']['properties']['name'] == 'urn:ogc:def:crs:EPSG::2056'
-
-        geometry_type = data['geometry']['type']
-        geometry = QgsGeometry()
+        # decoding, building and transforming the geometry is done in a background task
+        task = FeatureGeometryTask(
+            response.content, None if revalidate else self.coordinate_transform(),
+            lambda task: self.feature_geometry_finished(task, feature, generation, revalidate),
+            'SoLocator: {}'.format(feature)
+        )
+        self.feature_tasks[task] = revalidate
+        QgsApplication.taskManager().addTask(task)
 
-        if geometry_type.lower() == 'point':
-            geometry = QgsGeometry.fromPointXY(QgsPointXY(data['geometry']['coordinates'][0],
-                                                          data['geometry']['coordinates'][1]))
+    def feature_geometry_finished(self, task: FeatureGeometryTask, feature: FeatureResult, generation: int, revalidate: bool):
+        """
+        Called on the main thread when the geometry of a feature has been built
+        """
+        self.feature_tasks.pop(task, None)
+
+        if task.error is not None:
+            if isinstance(task.error, UnsupportedGeometryType):
+                # SoLocator does not handle {geometry_type} yet. Please contact support
+                self.info('SoLocator unterstützt den Geometrietyp {geometry_type} nicht.'
+                          ' Bitte kontaktieren Sie den Support.'.format(geometry_type=task.error.geometry_type),
+                          Qgis.MessageLevel.Warning)
+            else:
+                self.info('Error in feature response of {}: {}'.format(feature, task.error), Qgis.MessageLevel.Warning)
+        if task.geometry is None:
+            return
 
-        elif geometry_type.lower() == 'polygon':
-            rings = data['geometry']['coordinates']
-            for r in range(0, len(rings)):
-                for p in range(0, len(rings[r])):
-                    rings[r][p] = QgsPointXY(rings[r][p][0], rings[r][p][1])
-            geometry = QgsGeometry.fromPolygonXY(rings)
+        feature_store().put(feature.dataproduct_id, feature.feature_id, task.geometry)
+        if revalidate or self.is_stale(generation):
+            return
 
-        elif geometry_type.lower() == 'multipolygon':
-            islands = data['geometry']['coordinates']
-            for i in range(0, len(islands)):
-                for r in range(0, len(islands[i])):
-                    for p in range(0, len(islands[i][r])):
-                        islands[i][r][p] = QgsPointXY(islands[i][r][p][0], islands[i][r][p][1])
-            geometry = QgsGeometry.fromMultiPolygonXY(islands)
+        self.remember_municipality(feature, task.geometry)
+        self.highlight(task.transformed_geometry, feature.key())
 
+    def remember_municipality(self, feature: FeatureResult, geometry: QgsGeometry):
+        """
+        :param geometry: the geometry in EPSG:2056
+        """
+        if feature.dataproduct_id.startswith(MUNICIPALITY_DATAPRODUCT):
+            self.last_municipality = QgsGeometry(geometry)
 
-        else:
-            # SoLocator does not handle {geometry_type} yet. Please contact support
-            self.info('SoLocator unterstützt den Geometrietyp {geometry_type} nicht.'
-                      ' Bitte kontaktieren Sie den Support.'.format(geometry_type=geometry_type), Qgis.MessageLevel.Warning)
+    def show_all_features(self, show_all: ShowAllResult):
+        """
+        Fetches all the features of a search and shows them in temporary layers
+        """
+        if self.feature_batch is not None:
+            self.feature_batch.abort()
+        self.feature_batch = FeatureBatch(
+            self.iface, show_all.features, 'SoLocator: {}'.format(show_all.search), self.feature_batch_finished
+        )
+        self.feature_batch.start()
 
-        geometry.transform(self.transform_ch)
-        self.highlight(geometry)
+    def feature_batch_finished(self, batch: FeatureBatch):
+        if self.feature_batch is batch:
+            self.feature_batch = None
 
     def fetch_data_product(self, product: DataProductResult, alternate_mode: bool):
         self.dbg_info(product)
-        url = '{url}/{dataproduct_id}'.format(url=DATA_PRODUCT_URL, dataproduct_id=product.dataproduct_id)
-        self.nam_fetch_feature = NetworkAccessManager()
+        url = '{url}/{dataproduct_id}'.format(url=settings_snapshot().data_product_url, dataproduct_id=product.dataproduct_id)
+        generation = self.trigger_generation
         self.dbg_info(url)
         is_background = product.stacktype == 'background'
         self.dbg_info('is_background {}'.format(is_background))
-        self.nam_fetch_feature.finished.connect(lambda response: self.parse_data_product_response(response, is_background, alternate_mode))
-        self.nam_fetch_feature.request(url, headers=self.HEADERS, blocking=False)
+        self.nam_trigger = NAM_POOL.request(
+            url, headers=self.HEADERS,
+            callback=lambda response: self.parse_data_product_response(response, product, alternate_mode, generation)
+        )
 
-    def parse_data_product_response(self, response, is_background: bool, alternate_mode: bool):
-        if response.status_code != 200:
+    def parse_data_product_response(self, response, product: DataProductResult, alternate_mode: bool, generation: int):
+        if self.is_stale(generation):
+            return
+        # the request has completed, it must not be aborted anymore
+        self.nam_trigger = None
+
+        if response.status_code != 200 or not response.ok:
             if not isinstance(response.exception, RequestsExceptionUserAbort):
                 self.info("Error in feature response with status code: "
                           "{} from {}".format(response.status_code, response.url))
+            if response.status_code == 404:
+                # the data product does not exist anymore, it must not be found locally
+                layer_catalog().remove(product.dataproduct_id)
             return
 
-        data = json.loads(response.content.decode('utf-8'))
-        LayerLoader(data, self.iface, is_background, alternate_mode)
+        recent_results().cache(product.key(), dataproduct=response.content)
+        self.load_data_product(response.content, product.stacktype == 'background', alternate_mode)
+
+    def load_data_product(self, content, is_background: bool, alternate_mode: bool):
+        # imported here to avoid loading the layer modules at startup
+        from solocator.core.data_product_parser import parse_data_product
+        from solocator.core.layer_loader import LayerLoader
+        LayerLoader(parse_data_product(content, is_background), self.iface, is_background, alternate_mode)
 
     def info(self, msg="", level=Qgis.MessageLevel.Info):
         self.logMessage(str(msg), level)
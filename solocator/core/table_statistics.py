@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+
+ QGIS Solothurn Locator Plugin
+ Copyright (C) 2019 Denis Rouzaud
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import math
+import time
+
+from qgis.core import QgsDataSourceUri, QgsProviderRegistry, QgsProviderConnectionException, QgsRectangle
+
+from solocator.core.loading_mode import LoadingMode
+from solocator.core.metrics import METRICS
+from solocator.core.utils import dbg_info
+
+# seconds during which the statistics of a table are reused, they only change when the table is analyzed
+STATISTICS_MAX_AGE = 3600
+
+# (time, statistics) by connection and table
+_cache = {}
+
+# the tables are given as literals and resolved by the server, missing tables are skipped
+STATISTICS_SQL = """
+SELECT t.i, c.reltuples::bigint, {extent}
+FROM (VALUES {tables}) AS t(i, schema_name, table_name, geometry_column)
+JOIN pg_class c ON c.oid = to_regclass(quote_ident(t.schema_name) || '.' || quote_ident(t.table_name))
+{extent_join}
+"""
+EXTENT_SQL = 'ST_XMin(e), ST_YMin(e), ST_XMax(e), ST_YMax(e)'
+EXTENT_JOIN_SQL = 'CROSS JOIN LATERAL ST_EstimatedExtent(t.schema_name, t.table_name, t.geometry_column) AS e'
+
+
+class TableStatistics:
+    """
+    Estimated size of a PostGIS table, from the PostgreSQL catalog statistics
+    """
+    def __init__(self, row_count: int, extent: QgsRectangle = None):
+        """
+        :param row_count: the estimated number of rows, negative if unknown (table never analyzed)
+        :param extent: the estimated extent of the geometries, None if unknown
+        """
+        self.row_count = row_count
+        self.extent = extent
+
+    def __repr__(self):
+        return 'TableStatistics: {} rows, extent {}'.format(self.row_count, self.extent.toString() if self.extent else None)
+
+
+def quoted_literal(value: str) -> str:
+    return "'{}'".format(value.replace("'", "''"))
+
+
+def _key(uri: QgsDataSourceUri):
+    return uri.connectionInfo(False), uri.schema(), uri.table()
+
+
+def _is_cached(key) -> bool:
+    return key in _cache and time.monotonic() - _cache[key][0] <= STATISTICS_MAX_AGE
+
+
+def clear_table_statistics():
+    """
+    Forgets the cached statistics, e.g. when the connection settings have changed
+    """
+    _cache.clear()
+
+
+def _query_statistics(uris: list, with_extent: bool) -> dict:
+    """
+    Queries the statistics of tables of the same database
+    :return: the statistics by index in uris
+    """
+    connection = QgsProviderRegistry.instance().providerMetadata('postgres').createConnection(uris[0].uri(False), {})
+    tables = ', '.join('({}, {}, {}, {})'.format(
+        i, quoted_literal(uri.schema()), quoted_literal(uri.table()), quoted_literal(uri.geometryColumn())
+    ) for i, uri in enumerate(uris))
+    if with_extent:
+        sql = STATISTICS_SQL.format(extent=EXTENT_SQL, tables=tables, extent_join=EXTENT_JOIN_SQL)
+    else:
+        sql = STATISTICS_SQL.format(extent='NULL, NULL, NULL, NULL', tables=tables, extent_join='')
+    statistics = {}
+    for row in connection.executeSql(sql):
+        extent = None
+        if None not in row[2:]:
+            extent = QgsRectangle(*[float(v) for v in row[2:]])
+        statistics[int(row[0])] = TableStatistics(int(row[1]), extent)
+    return statistics
+
+
+def prefetch_table_statistics(uris: list):
+    """
+    Estimates the number of rows and the extent of tables without scanning them, with one query per database.
+    The statistics are cached, see estimate_table_statistics.
+    :param uris: the URIs of the PostGIS layers
+    """
+    by_connection = {}
+    for uri in uris:
+        key = _key(uri)
+        if not _is_cached(key):
+            by_connection.setdefault(key[0], {})[key] = uri
+    for connection_info, tables in by_connection.items():
+        uris = list(tables.values())
+        statistics = {}
+        try:
+            try:
+                statistics = _query_statistics(uris, True)
+            except QgsProviderConnectionException as e:
+                # e.g. a geometry column without statistics
+                dbg_info('could not estimate extents, estimating sizes only: {}'.format(e))
+                statistics = _query_statistics(uris, False)
+        except QgsProviderConnectionException as e:
+            dbg_info('could not estimate size of {} tables: {}'.format(len(uris), e))
+        now = time.monotonic()
+        for i, key in enumerate(tables.keys()):
+            dbg_info('statistics of {}.{}: {}'.format(key[1], key[2], statistics.get(i)))
+            _cache[key] = (now, statistics.get(i))
+
+
+def estimate_table_statistics(uri: QgsDataSourceUri) -> TableStatistics:
+    """
+    Estimates the number of rows and the extent of a table without scanning it
+    :param uri: the URI of the PostGIS layer
+    :return: the statistics, None if they could not be retrieved
+    """
+    key = _key(uri)
+    cached = _is_cached(key)
+    METRICS.record_cache('table_statistics', cached)
+    if not cached:
+        prefetch_table_statistics([uri])
+    return _cache[key][1]
+
+
+def choose_loading_mode(statistics: TableStatistics, visible_extent: QgsRectangle, max_features: int) -> LoadingMode:
+    """
+    Chooses to load a table from PostgreSQL if the number of features to be displayed is small enough, as WMS otherwise.
+    Features are assumed to be evenly distributed over the extent of the table.
+    :param statistics: the table statistics
+    :param visible_extent: the visible extent (EPSG:2056), None to consider the whole table
+    :param max_features: the maximum number of features to load from PostgreSQL
+    """
+    if statistics is None or statistics.row_count < 0:
+        return LoadingMode.WMS
+    features = statistics.row_count
+    if visible_extent is not None and statistics.extent is not None and statistics.extent.area() > 0:
+        visible_fraction = statistics.extent.intersect(visible_extent).area() / statistics.extent.area()
+        features *= visible_fraction
+    return LoadingMode.PG if features <= max_features else LoadingMode.WMS
+
+
+def max_visible_scale(statistics: TableStatistics, visible_extent: QgsRectangle, visible_scale: float,
+                      max_features: int) -> float:
+    """
+    Returns the most zoomed out scale at which a table loaded from PostgreSQL stays below the maximum number of features.
+    A table chosen from the visible extent would otherwise render all its features once the user zooms out.
+    Features are assumed to be evenly distributed over the extent of the table.
+    :return: the scale denominator, 0 if the whole table can be displayed
+    """
+    if statistics is None or statistics.row_count <= max_features:
+        return 0
+    if visible_extent is None or not visible_scale or statistics.extent is None or statistics.extent.area() <= 0:
+        # cannot be estimated, the layer is only shown at the current scale or closer
+        return visible_scale or 0
+    density = statistics.row_count / statistics.extent.area()
+    visible_features = density * visible_extent.area()
+    if visible_features <= 0:
+        return visible_scale
+    # the visible area grows with the square of the scale
+    return visible_scale * math.sqrt(max_features / visible_features)
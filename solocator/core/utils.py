@@ -17,7 +17,9 @@
  ***************************************************************************/
 """
 
-from qgis.core import Qgis, QgsMessageLog
+import os
+
+from qgis.core import Qgis, QgsMessageLog, QgsApplication
 from qgis.utils import iface
 
 DEBUG = True
@@ -25,9 +27,21 @@ DEBUG = True
 
 def info(message: str, level: Qgis.MessageLevel = Qgis.MessageLevel.Info):
     QgsMessageLog.logMessage("{}: {}".format('SoLocator', message), "Locator bar", level)
-    iface.messageBar().pushMessage('SoLocator', message, level)
+    # there is no interface when running headless (e.g. project generation)
+    if iface is not None:
+        iface.messageBar().pushMessage('SoLocator', message, level)
 
 
 def dbg_info(message: str):
     if DEBUG:
-        QgsMessageLog.logMessage("{}: {}".format('SoLocator', message), "Locator bar", Qgis.MessageLevel.Info)
\ No newline at end of file
+        QgsMessageLog.logMessage("{}: {}".format('SoLocator', message), "Locator bar", Qgis.MessageLevel.Info)
+
+
+def local_file_path(file_name: str) -> str:
+    """
+    Returns the path of a file stored by SoLocator in the QGIS profile folder
+    :param file_name: the name of the file
+    """
+    path = os.path.join(QgsApplication.qgisSettingsDirPath(), 'solocator')
+    os.makedirs(path, exist_ok=True)
+    return os.path.join(path, file_name)
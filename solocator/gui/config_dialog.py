@@ -18,14 +18,15 @@
 """
 
 import os
-from qgis.PyQt.QtCore import Qt, pyqtSlot
-from qgis.PyQt.QtWidgets import QDialog, QTableWidgetItem, QAbstractItemView
+from qgis.PyQt.QtCore import pyqtSlot
+from qgis.PyQt.QtWidgets import QDialog, QAbstractItemView, QHeaderView
 from qgis.PyQt.uic import loadUiType
 
-from solocator.core.data_products import DATA_PRODUCTS
+from solocator.core.data_product_catalog import data_product_catalog
 from solocator.qgis_setting_manager import SettingDialog, UpdateMode
-from solocator.qgis_setting_manager.widgets import TableWidgetStringListWidget
 from solocator.core.settings import Settings, DEFAULT_PG_HOST, DEFAULT_PG_SERVICE, DEFAULT_BASE_URL
+from solocator.core.profiling import default_profile_directory
+from solocator.gui.data_product_model import DataProductModel, DataProductFilterProxyModel
 
 DialogUi, _ = loadUiType(os.path.join(os.path.dirname(__file__), '../ui/config.ui'))
 
@@ -43,30 +44,21 @@ class ConfigDialog(QDialog, DialogUi, SettingDialog):
         self.keep_scale.toggled.connect(self.point_scale.setDisabled)
         self.keep_scale.toggled.connect(self.scale_label.setDisabled)
 
-        self.skipped_dataproducts.setRowCount(len(DATA_PRODUCTS))
-        self.skipped_dataproducts.setColumnCount(2)
-        self.skipped_dataproducts.setHorizontalHeaderLabels((self.tr('Name'), self.tr('ID')))
-        self.skipped_dataproducts.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
-        self.skipped_dataproducts.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
-        r = 0
-        for _id, name in DATA_PRODUCTS.items():
-            item = QTableWidgetItem(name)
-            item.setData(Qt.ItemDataRole.UserRole, _id)
-            item.setFlags(Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsUserCheckable)
-            self.skipped_dataproducts.setItem(r, 0, item)
-            self.skipped_dataproducts.setItem(r, 1, QTableWidgetItem(_id))
-            r += 1
-        self.skipped_dataproducts.horizontalHeader().setStretchLastSection(True)
-        self.skipped_dataproducts.resizeColumnsToContents()
+        # skipped data products are not handled by the setting manager but through the model
+        self.data_product_model = DataProductModel(data_product_catalog().items(), settings.value('skipped_dataproducts'), self)
+        self.data_product_proxy_model = DataProductFilterProxyModel(self)
+        self.data_product_proxy_model.setSourceModel(self.data_product_model)
+        self.dataproducts_view.setModel(self.data_product_proxy_model)
+        self.dataproducts_view.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.dataproducts_view.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
+        self.dataproducts_view.verticalHeader().hide()
+        self.dataproducts_view.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.ResizeToContents)
+        self.dataproducts_view.horizontalHeader().setStretchLastSection(True)
+        self.accepted.connect(self.save_skipped_dataproducts)
 
         self.settings = settings
         self.init_widgets()
 
-        sd_widget: TableWidgetStringListWidget = self.setting_widget('skipped_dataproducts')
-        sd_widget.column = 0
-        sd_widget.userdata = True
-        sd_widget.invert = True
-
         self.setting_widget('wms_image_format').auto_populate()
         self.setting_widget('default_layer_loading_mode').auto_populate()
 
@@ -75,22 +67,15 @@ class ConfigDialog(QDialog, DialogUi, SettingDialog):
         self.service_url.setPlaceholderText(DEFAULT_BASE_URL)
         self.pg_host.setShowClearButton(True)
         self.service_url.setShowClearButton(True)
+        self.profile_directory.setPlaceholderText(default_profile_directory())
+        self.profile_directory.setShowClearButton(True)
 
     def select_all(self, select: bool = True):
-        for r in range(self.skipped_dataproducts.rowCount()):
-            item = self.skipped_dataproducts.item(r, 0)
-            item.setCheckState(Qt.CheckState.Checked if select else Qt.CheckState.Unchecked)
+        self.data_product_model.set_all_checked(select)
 
     @pyqtSlot(str)
     def filter_rows(self, text: str):
-        if text:
-            items = self.skipped_dataproducts.findItems(text, Qt.MatchFlag.MatchContains)
-            shown_rows = []
-            for item in items:
-                shown_rows.append(item.row())
-            shown_rows = list(set(shown_rows))
-            for r in range(self.skipped_dataproducts.rowCount()):
-                self.skipped_dataproducts.setRowHidden(r, r not in shown_rows)
-        else:
-            for r in range(self.skipped_dataproducts.rowCount()):
-                self.skipped_dataproducts.setRowHidden(r, False)
+        self.data_product_proxy_model.set_filter_text(text)
+
+    def save_skipped_dataproducts(self):
+        self.settings.set_value('skipped_dataproducts', self.data_product_model.skipped())
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+
+ QGIS Solothurn Locator Plugin
+ Copyright (C) 2019 Denis Rouzaud
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from qgis.PyQt.QtCore import Qt, QAbstractTableModel, QModelIndex, QSortFilterProxyModel
+
+
+class DataProductModel(QAbstractTableModel):
+    """
+    A table model of the data products (name, ID) which can be checked to be used in the search
+    """
+    NAME_COLUMN = 0
+    ID_COLUMN = 1
+
+    def __init__(self, data_products: list, skipped: list, parent=None):
+        """
+        :param data_products: list of (ID, name)
+        :param skipped: the IDs of the unchecked data products
+        """
+        super().__init__(parent)
+        self.data_products = data_products
+        skipped = set(skipped or [])
+        self.checked = [_id not in skipped for _id, _ in data_products]
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.data_products)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else 2
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return (self.tr('Name'), self.tr('ID'))[section]
+        return None
+
+    def flags(self, index):
+        if index.column() == self.NAME_COLUMN:
+            return Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsUserCheckable
+        return Qt.ItemFlag.ItemIsEnabled
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        _id, name = self.data_products[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return name if index.column() == self.NAME_COLUMN else _id
+        if role == Qt.ItemDataRole.CheckStateRole and index.column() == self.NAME_COLUMN:
+            return Qt.CheckState.Checked if self.checked[index.row()] else Qt.CheckState.Unchecked
+        if role == Qt.ItemDataRole.UserRole:
+            return _id
+        return None
+
+    def setData(self, index, value, role=Qt.ItemDataRole.EditRole):
+        if role == Qt.ItemDataRole.CheckStateRole and index.column() == self.NAME_COLUMN:
+            # value is an int in Qt5 and an enum in Qt6
+            self.checked[index.row()] = Qt.CheckState(value) == Qt.CheckState.Checked
+            self.dataChanged.emit(index, index, [role])
+            return True
+        return False
+
+    def set_all_checked(self, checked: bool = True):
+        self.checked = [checked] * len(self.data_products)
+        self.dataChanged.emit(self.index(0, self.NAME_COLUMN), self.index(self.rowCount() - 1, self.NAME_COLUMN))
+
+    def skipped(self) -> list:
+        return [_id for (_id, _), checked in zip(self.data_products, self.checked) if not checked]
+
+
+class DataProductFilterProxyModel(QSortFilterProxyModel):
+    """
+    Filters the data products on their name or ID.
+    The lowercase texts of the rows are indexed once, and when the filter text is extended
+    (i.e. while typing) only the rows matching the previous text are searched again.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.index_texts = []
+        self.filter_text = ''
+        self.matching_rows = None
+
+    def setSourceModel(self, model: DataProductModel):
+        self.index_texts = ['{}\n{}'.format(name, _id).lower() for _id, name in model.data_products]
+        self.filter_text = ''
+        self.matching_rows = None
+        super().setSourceModel(model)
+
+    def set_filter_text(self, text: str):
+        text = text.lower()
+        if not text:
+            self.matching_rows = None
+        else:
+            if self.matching_rows is not None and text.startswith(self.filter_text):
+                candidates = self.matching_rows
+            else:
+                candidates = range(len(self.index_texts))
+            self.matching_rows = {row for row in candidates if text in self.index_texts[row]}
+        self.filter_text = text
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        return self.matching_rows is None or source_row in self.matching_rows
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+
+ QGIS Solothurn Locator Plugin
+ Copyright (C) 2019 Denis Rouzaud
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from collections import deque
+
+from qgis.PyQt.QtWidgets import QAction
+from qgis.core import Qgis, QgsProject, QgsGeometry, QgsRectangle, QgsCoordinateTransform, \
+    QgsCoordinateReferenceSystem, QgsApplication, QgsCsException
+from qgis.gui import QgisInterface
+
+from solocator.core.snapshot import SnapshotTask, PG_SOURCE_PROPERTY, SNAPSHOT_EXTENT_PROPERTY, is_solocator_pg_layer, \
+    is_snapshot, use_snapshot, revert_snapshot, snapshot_layer_table
+
+if hasattr(Qgis, 'LayerType'):
+    VECTOR_LAYER_TYPE = Qgis.LayerType.Vector
+else:
+    from qgis.core import QgsMapLayerType
+    VECTOR_LAYER_TYPE = QgsMapLayerType.VectorLayer
+MENU = 'SoLocator'
+
+
+class SnapshotActions:
+    """
+    Layer actions to copy the layers loaded from PostgreSQL to a local GeoPackage (snapshot),
+    to refresh the snapshot and to revert to PostgreSQL.
+    They apply to the selected layers (or the layers of the selected groups) loaded by SoLocator.
+    Since all the snapshots are written to the same GeoPackage, the tasks are queued and run one after the other.
+    """
+
+    def __init__(self, iface: QgisInterface, municipality_geometry):
+        """
+        :param municipality_geometry: a callable returning the geometry (EPSG:2056) of the last found municipality or None
+        """
+        self.iface = iface
+        self.municipality_geometry = municipality_geometry
+        # the layers of the snapshots waiting for the running task
+        self.queue = deque()
+        self.task = None
+        # tables not read anymore (replaced or reverted snapshots), dropped by the next task
+        self.obsolete_tables = set()
+        self.actions = []
+        for text, slot in (
+                ('Lokale Kopie erstellen (Kartenausschnitt)', self.snapshot_canvas_extent),
+                ('Lokale Kopie erstellen (zuletzt gesuchte Gemeinde)', self.snapshot_municipality),
+                ('Lokale Kopie aktualisieren', self.refresh_snapshots),
+                ('PostgreSQL wiederherstellen', self.revert_snapshots)
+        ):
+            action = QAction(text, self.iface.mainWindow())
+            action.triggered.connect(slot)
+            self.iface.addCustomActionForLayerType(action, MENU, VECTOR_LAYER_TYPE, False)
+            self.actions.append(action)
+
+        QgsProject.instance().layersAdded.connect(self.add_layers)
+        self.add_layers(QgsProject.instance().mapLayers().values())
+
+    def unload(self):
+        QgsProject.instance().layersAdded.disconnect(self.add_layers)
+        self.queue.clear()
+        if self.task is not None:
+            self.task.cancel()
+        for action in self.actions:
+            self.iface.removeCustomActionForLayerType(action)
+
+    def add_layers(self, layers):
+        for layer in layers:
+            if is_solocator_pg_layer(layer):
+                for action in self.actions:
+                    self.iface.addCustomActionForLayer(action, layer)
+
+    def selected_layers(self) -> list:
+        layers = self.iface.layerTreeView().selectedLayersRecursive() or [self.iface.activeLayer()]
+        return [layer for layer in layers if is_solocator_pg_layer(layer)]
+
+    @staticmethod
+    def transform_extent(extent: QgsRectangle, crs: QgsCoordinateReferenceSystem, layer) -> QgsRectangle:
+        transform = QgsCoordinateTransform(crs, layer.crs(), QgsProject.instance())
+        try:
+            return transform.transformBoundingBox(extent)
+        except QgsCsException:
+            return None
+
+    def snapshot_canvas_extent(self):
+        canvas = self.iface.mapCanvas()
+        crs = canvas.mapSettings().destinationCrs()
+        self.snapshot([(layer, self.transform_extent(canvas.extent(), crs, layer)) for layer in self.selected_layers()])
+
+    def snapshot_municipality(self):
+        geometry = self.municipality_geometry()
+        if geometry is None:
+            # Search a municipality first
+            self.iface.messageBar().pushMessage('SoLocator', 'Bitte zuerst eine Gemeinde suchen.', Qgis.MessageLevel.Warning)
+            return
+        crs = QgsCoordinateReferenceSystem('EPSG:2056')
+        self.snapshot([
+            (layer, self.transform_extent(geometry.boundingBox(), crs, layer)) for layer in self.selected_layers()
+        ])
+
+    def refresh_snapshots(self):
+        self.snapshot([
+            (layer, QgsGeometry.fromWkt(layer.customProperty(SNAPSHOT_EXTENT_PROPERTY)).boundingBox())
+            for layer in self.selected_layers() if is_snapshot(layer)
+        ])
+
+    def revert_snapshots(self):
+        for layer in self.selected_layers():
+            if is_snapshot(layer):
+                self.obsolete_tables.add(snapshot_layer_table(layer))
+                revert_snapshot(layer)
+
+    def snapshot(self, layers_extents: list):
+        """
+        :param layers_extents: list of (layer, extent in the layer CRS)
+        """
+        layers = [
+            (layer.id(), layer.customProperty(PG_SOURCE_PROPERTY), layer.name(), extent)
+            for layer, extent in layers_extents if extent is not None
+        ]
+        if not layers:
+            return
+        self.queue.append(layers)
+        self.start_next()
+
+    def start_next(self):
+        if self.task is not None or not self.queue:
+            return
+        self.task = SnapshotTask(
+            self.queue.popleft(), QgsProject.instance().transformContext(), self.snapshot_finished, self.obsolete_tables
+        )
+        self.obsolete_tables = set()
+        QgsApplication.taskManager().addTask(self.task)
+
+    def snapshot_finished(self, task: SnapshotTask):
+        self.task = None
+        for layer_id, source, extent in task.exported:
+            layer = QgsProject.instance().mapLayer(layer_id)
+            if layer is not None:
+                if is_snapshot(layer):
+                    # the layer now reads the new table
+                    self.obsolete_tables.add(snapshot_layer_table(layer))
+                use_snapshot(layer, source, extent)
+        if task.exported:
+            # {count} layers are now read from the local copy
+            self.iface.messageBar().pushMessage(
+                'SoLocator', '{} Layer werden aus der lokalen Kopie gelesen.'.format(len(task.exported)),
+                Qgis.MessageLevel.Success
+            )
+        self.start_next()
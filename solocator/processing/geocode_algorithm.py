@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+
+ QGIS Solothurn Locator Plugin
+ Copyright (C) 2019 Denis Rouzaud
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from difflib import SequenceMatcher
+
+from qgis.PyQt.QtCore import QCoreApplication, QVariant, QMetaType
+from qgis.core import Qgis, QgsProcessing, QgsProcessingAlgorithm, QgsProcessingParameterFeatureSource, \
+    QgsProcessingParameterField, QgsProcessingParameterString, QgsProcessingParameterNumber, \
+    QgsProcessingParameterFileDestination, QgsProcessingParameterFeatureSink, QgsProcessingException, \
+    QgsFeature, QgsFeatureSink, QgsField, QgsFields, QgsGeometry, QgsWkbTypes, QgsCoordinateReferenceSystem
+
+from solocator.core.feature_task import UnsupportedGeometryType
+from solocator.core.network_access_manager import RequestsException, RequestsExceptionUserAbort
+from solocator.core.search_client import search, fetch_feature_geometry
+
+DEFAULT_DATAPRODUCTS = 'ch.so.agi.av.gebaeudeadressen.gebaeudeeingaenge'
+# number of search results compared to the searched value
+SEARCH_LIMIT = 5
+# the checkpoint file is written every CHECKPOINT_INTERVAL geocoded values
+CHECKPOINT_INTERVAL = 50
+
+# enums moved to Qgis in recent versions
+if Qgis.QGIS_VERSION_INT >= 33800:
+    STRING_TYPE, DOUBLE_TYPE = QMetaType.Type.QString, QMetaType.Type.Double
+else:
+    STRING_TYPE, DOUBLE_TYPE = QVariant.String, QVariant.Double
+WKB_TYPE = Qgis.WkbType if hasattr(Qgis, 'WkbType') else QgsWkbTypes.Type
+VECTOR_SOURCE_TYPE = Qgis.ProcessingSourceType.Vector if hasattr(Qgis, 'ProcessingSourceType') \
+    else QgsProcessing.SourceType.TypeVector
+STRING_FIELD_TYPE = Qgis.ProcessingFieldParameterDataType.String if hasattr(Qgis, 'ProcessingFieldParameterDataType') \
+    else QgsProcessingParameterField.DataType.String
+NUMBER_TYPE = Qgis.ProcessingNumberParameterType if hasattr(Qgis, 'ProcessingNumberParameterType') \
+    else QgsProcessingParameterNumber.Type
+
+
+class RateLimiter:
+    """
+    Spaces the requests of all threads to respect a maximum rate
+    """
+    def __init__(self, rate: float):
+        """
+        :param rate: the maximum number of requests per second, 0 for no limit
+        """
+        self.interval = 1 / rate if rate > 0 else 0
+        self.lock = threading.Lock()
+        self.next_time = 0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_time)
+            self.next_time = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def match_score(value: str, display: str) -> float:
+    """
+    Returns the similarity (0 to 1) between the searched value and a result
+    """
+    return SequenceMatcher(None, value.lower(), display.lower()).ratio()
+
+
+class GeocodeAlgorithm(QgsProcessingAlgorithm):
+    INPUT = 'INPUT'
+    FIELD = 'FIELD'
+    DATAPRODUCTS = 'DATAPRODUCTS'
+    MAX_CONCURRENT = 'MAX_CONCURRENT'
+    RATE_LIMIT = 'RATE_LIMIT'
+    CHECKPOINT = 'CHECKPOINT'
+    OUTPUT_POINTS = 'OUTPUT_POINTS'
+    OUTPUT_POLYGONS = 'OUTPUT_POLYGONS'
+
+    def tr(self, string):
+        return QCoreApplication.translate('SoLocator', string)
+
+    def createInstance(self):
+        return GeocodeAlgorithm()
+
+    def name(self):
+        return 'geocode'
+
+    def displayName(self):
+        return self.tr('Tabelle geokodieren')
+
+    def shortHelpString(self):
+        return self.tr(
+            'Sucht die Werte eines Feldes (z.B. Adressen) mit der SoLocator Suche und gibt die Geometrie '
+            'des besten Treffers mit dessen Übereinstimmung (so_score, 0 bis 1) und Datenprodukt zurück. '
+            'Punkte und Flächen werden in getrennte Layer geschrieben, Werte ohne Treffer ohne Geometrie in den Punktlayer. '
+            'Mit einer Checkpoint-Datei kann eine abgebrochene Geokodierung fortgesetzt werden.'
+        )
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(QgsProcessingParameterFeatureSource(self.INPUT, self.tr('Tabelle'), [VECTOR_SOURCE_TYPE]))
+        self.addParameter(QgsProcessingParameterField(
+            self.FIELD, self.tr('Zu suchendes Feld'), parentLayerParameterName=self.INPUT, type=STRING_FIELD_TYPE
+        ))
+        self.addParameter(QgsProcessingParameterString(
+            self.DATAPRODUCTS, self.tr('Datenprodukte (kommagetrennt)'), defaultValue=DEFAULT_DATAPRODUCTS
+        ))
+        self.addParameter(QgsProcessingParameterNumber(
+            self.MAX_CONCURRENT, self.tr('Maximale Anzahl gleichzeitiger Anfragen'),
+            NUMBER_TYPE.Integer, defaultValue=4, minValue=1, maxValue=32
+        ))
+        self.addParameter(QgsProcessingParameterNumber(
+            self.RATE_LIMIT, self.tr('Maximale Anzahl Anfragen pro Sekunde (0: unbegrenzt)'),
+            NUMBER_TYPE.Double, defaultValue=10, minValue=0
+        ))
+        self.addParameter(QgsProcessingParameterFileDestination(
+            self.CHECKPOINT, self.tr('Checkpoint-Datei'), 'JSON (*.json)', optional=True, createByDefault=False
+        ))
+        self.addParameter(QgsProcessingParameterFeatureSink(self.OUTPUT_POINTS, self.tr('Punkte'), optional=True))
+        self.addParameter(QgsProcessingParameterFeatureSink(
+            self.OUTPUT_POLYGONS, self.tr('Flächen'), optional=True, createByDefault=False
+        ))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        source = self.parameterAsSource(parameters, self.INPUT, context)
+        if source is None:
+            raise QgsProcessingException(self.invalidSourceError(parameters, self.INPUT))
+        field = self.parameterAsString(parameters, self.FIELD, context)
+        dataproducts = self.parameterAsString(parameters, self.DATAPRODUCTS, context) or DEFAULT_DATAPRODUCTS
+        max_concurrent = self.parameterAsInt(parameters, self.MAX_CONCURRENT, context)
+        rate_limiter = RateLimiter(self.parameterAsDouble(parameters, self.RATE_LIMIT, context))
+        checkpoint_path = self.parameterAsFileOutput(parameters, self.CHECKPOINT, context)
+
+        field_index = source.fields().lookupField(field)
+        values = {}
+        for feature in source.getFeatures():
+            value = feature[field_index]
+            if value:
+                values[str(value).strip()] = None
+
+        # values already geocoded in a previous run
+        geocoded = self.read_checkpoint(checkpoint_path, feedback)
+        pending = [value for value in values if value not in geocoded]
+        feedback.pushInfo(self.tr('{} Werte zu geokodieren ({} aus dem Checkpoint)').format(
+            len(pending), len(values) - len(pending)
+        ))
+
+        # repeated values are only geocoded once
+        with ThreadPoolExecutor(max_workers=max_concurrent) as executor:
+            futures = {
+                executor.submit(self.geocode, value, dataproducts, rate_limiter, feedback): value for value in pending
+            }
+            not_done = set(futures)
+            done_count = 0
+            while not_done and not feedback.isCanceled():
+                done, not_done = wait(not_done, timeout=0.5, return_when=FIRST_COMPLETED)
+                for future in done:
+                    value = futures[future]
+                    try:
+                        geocoded[value] = future.result()
+                    except RequestsExceptionUserAbort:
+                        continue
+                    except (RequestsException, UnsupportedGeometryType, ValueError, KeyError) as e:
+                        # not stored, it is retried on the next run
+                        feedback.reportError(self.tr('{}: {}').format(value, e))
+                    done_count += 1
+                    if checkpoint_path and done_count % CHECKPOINT_INTERVAL == 0:
+                        self.write_checkpoint(checkpoint_path, geocoded)
+                    feedback.setProgress(90 * done_count / len(pending))
+            if feedback.isCanceled():
+                for future in not_done:
+                    future.cancel()
+
+        if checkpoint_path:
+            self.write_checkpoint(checkpoint_path, geocoded)
+        if feedback.isCanceled():
+            return {}
+
+        return self.write_outputs(parameters, context, feedback, source, field_index, geocoded)
+
+    def geocode(self, value: str, dataproducts: str, rate_limiter: RateLimiter, feedback) -> dict:
+        """
+        Geocodes a value (in a worker thread)
+        :return: the best match or None if nothing was found
+        """
+        if feedback.isCanceled():
+            raise RequestsExceptionUserAbort()
+        rate_limiter.wait()
+        data = search(value, dataproducts, SEARCH_LIMIT, feedback)
+        candidates = [res['feature'] for res in data['results'] if 'feature' in res]
+        if not candidates:
+            return None
+        best = max(candidates, key=lambda candidate: match_score(value, candidate['display']))
+        rate_limiter.wait()
+        geometry = fetch_feature_geometry(best['dataproduct_id'], best['feature_id'], feedback)
+        return {
+            'display': best['display'],
+            'dataproduct_id': best['dataproduct_id'],
+            'feature_id': str(best['feature_id']),
+            'score': round(match_score(value, best['display']), 3),
+            'wkt': geometry.asWkt()
+        }
+
+    def write_outputs(self, parameters, context, feedback, source, field_index: int, geocoded: dict) -> dict:
+        fields = QgsFields(source.fields())
+        fields.append(QgsField('so_display', STRING_TYPE))
+        fields.append(QgsField('so_dataproduct_id', STRING_TYPE))
+        fields.append(QgsField('so_feature_id', STRING_TYPE))
+        fields.append(QgsField('so_score', DOUBLE_TYPE))
+        crs = QgsCoordinateReferenceSystem('EPSG:2056')
+        (points, points_id) = self.parameterAsSink(parameters, self.OUTPUT_POINTS, context, fields, WKB_TYPE.Point, crs)
+        (polygons, polygons_id) = self.parameterAsSink(
+            parameters, self.OUTPUT_POLYGONS, context, fields, WKB_TYPE.MultiPolygon, crs
+        )
+
+        total = source.featureCount() or 1
+        for i, feature in enumerate(source.getFeatures()):
+            if feedback.isCanceled():
+                break
+            value = feature[field_index]
+            match = geocoded.get(str(value).strip()) if value else None
+            output = QgsFeature(fields)
+            attributes = feature.attributes()
+            sink = points
+            if match:
+                attributes += [match['display'], match['dataproduct_id'], match['feature_id'], match['score']]
+                geometry = QgsGeometry.fromWkt(match['wkt'])
+                if geometry.type() == QgsWkbTypes.GeometryType.PolygonGeometry:
+                    geometry.convertToMultiType()
+                    sink = polygons
+                output.setGeometry(geometry)
+            else:
+                attributes += [None, None, None, 0]
+            output.setAttributes(attributes)
+            if sink is not None:
+                sink.addFeature(output, QgsFeatureSink.Flag.FastInsert)
+            feedback.setProgress(90 + 10 * i / total)
+
+        results = {}
+        if points is not None:
+            results[self.OUTPUT_POINTS] = points_id
+        if polygons is not None:
+            results[self.OUTPUT_POLYGONS] = polygons_id
+        return results
+
+    def read_checkpoint(self, path: str, feedback) -> dict:
+        if not path or not os.path.exists(path):
+            return {}
+        try:
+            with open(path, encoding='utf-8') as fh:
+                return json.load(fh)
+        except (OSError, ValueError) as e:
+            feedback.reportError(self.tr('Checkpoint-Datei konnte nicht gelesen werden: {}').format(e))
+            return {}
+
+    def write_checkpoint(self, path: str, geocoded: dict):
+        tmp_path = '{}.tmp'.format(path)
+        with open(tmp_path, 'w', encoding='utf-8') as fh:
+            json.dump(geocoded, fh)
+        os.replace(tmp_path, path)
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+
+ QGIS Solothurn Locator Plugin
+ Copyright (C) 2019 Denis Rouzaud
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+
+from qgis.PyQt.QtGui import QIcon
+from qgis.core import QgsProcessingProvider
+
+from solocator import PLUGIN_DIR
+from solocator.processing.geocode_algorithm import GeocodeAlgorithm
+
+
+class SoLocatorProvider(QgsProcessingProvider):
+    def id(self):
+        return 'solocator'
+
+    def name(self):
+        return 'SoLocator'
+
+    def icon(self):
+        return QIcon(os.path.join(PLUGIN_DIR, 'icons', 'solocator.png'))
+
+    def loadAlgorithms(self):
+        self.addAlgorithm(GeocodeAlgorithm())
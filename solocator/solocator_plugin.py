@@ -18,9 +18,13 @@
 """
 
 from qgis.PyQt.QtWidgets import QWidget
-from qgis.core import Qgis
+from qgis.core import Qgis, QgsApplication
 from qgis.gui import QgisInterface, QgsMessageBarItem
 from solocator.core.solocator_filter import SoLocatorFilter
+from solocator.core.metrics import init_metrics_writer, metrics_writer
+from solocator.core.profiling import init_profiler
+from solocator.core.recent_results import recent_results
+from solocator.core.feature_store import feature_store
 
 
 class SoLocatorPlugin:
@@ -28,12 +32,28 @@ class SoLocatorPlugin:
         self.iface = iface
         self.locator_filter = SoLocatorFilter(iface)
         self.iface.registerLocatorFilter(self.locator_filter)
+        self.processing_provider = None
+        self.snapshot_actions = None
 
     def initGui(self):
-        pass
+        init_profiler()
+        init_metrics_writer()
+        from solocator.processing.provider import SoLocatorProvider
+        self.processing_provider = SoLocatorProvider()
+        QgsApplication.processingRegistry().addProvider(self.processing_provider)
+        from solocator.gui.snapshot_actions import SnapshotActions
+        self.snapshot_actions = SnapshotActions(self.iface, lambda: self.locator_filter.last_municipality)
 
     def unload(self):
         self.iface.deregisterLocatorFilter(self.locator_filter)
+        if self.processing_provider is not None:
+            QgsApplication.processingRegistry().removeProvider(self.processing_provider)
+        if self.snapshot_actions is not None:
+            self.snapshot_actions.unload()
+        if metrics_writer() is not None:
+            metrics_writer().stop()
+        recent_results().flush()
+        feature_store().close()
 
     def show_message(self, title: str, msg: str, level: Qgis.MessageLevel, widget: QWidget = None):
         if widget: